@@ -1,40 +1,174 @@
+from collections import OrderedDict
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable, Iterable, Optional
+import threading
+import numpy as np
 import pandas as pd 
 import function as fct
+import instrumentation
 import logging
-from sentier_data_tools.iri import ProductIRI
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
-    
+# mass of N2O per mass of N2O-N
+N2O_N_TO_N2O = (28+16)/28
+# this should be handled by unit conversion at some point
+M2_PER_HA = 10000
+
+EF_PATH = Path(__file__).parent.parent / "docs" / "EF.csv"
+EF_KEY = ["crop_iri", "climate_type", "fert_type", "value_type"]
+EF_CATEGORIES = ["climate_type", "fert_type", "value_type"]
+INORGANIC_FERT_TYPES = ("default", "inorganic")
+# columns of resolved emission factor rows, also when nothing matched
+FACTOR_COLUMNS = ["climate_type", "fert_type", "value_type", "emission_factor"]
+
+
+class EmissionFactorStore:
+    """The IPCC emission factor table, parsed once and indexed by `EF_KEY`.
+
+    `get` is a single dict lookup; `factors` returns the precomputed rows of a
+    crop (and climate) without filtering the whole table."""
+
+    def __init__(self, df: pd.DataFrame):
+        df = df.astype({column: "category" for column in EF_CATEGORIES})
+        self.table = df.set_index(EF_KEY).sort_index()
+        self._values = dict(zip(self.table.index, self.table["emission_factor"].to_numpy()))
+        self._by_crop = {crop: rows for crop, rows in df.groupby("crop_iri", sort=False)}
+        self._by_crop_climate = {
+            key: rows for key, rows in df.groupby(["crop_iri", "climate_type"], sort=False, observed=True)
+        }
+        self.matcher = fct.IRIMatcher([fct.intern_iri(iri) for iri in self._by_crop])
+
+    @classmethod
+    def from_csv(cls, path: Path = EF_PATH) -> "EmissionFactorStore":
+        return cls(pd.read_csv(path, sep=';'))
+
+    def get(self, crop_iri, climate_type: str, fert_type: str, value_type: str = "value") -> float:
+        return self._values[(str(crop_iri), climate_type, fert_type, value_type)]
+
+    def factors(self, crop_iri, climate_type: str = None) -> pd.DataFrame:
+        if climate_type is None:
+            rows = self._by_crop.get(str(crop_iri))
+        else:
+            rows = self._by_crop_climate.get((str(crop_iri), climate_type))
+        if rows is None:
+            return self.table.iloc[0:0].reset_index()
+        return rows.copy()
+
+    def match(self, product_IRI: "ProductIRI"):
+        """Closest crop IRI in the table, exact or broader."""
+        return self.matcher(product_IRI)
+
+
+@lru_cache(maxsize=1)
+def emission_factor_store() -> EmissionFactorStore:
+    return EmissionFactorStore.from_csv()
+
+
+def select_factors(df: pd.DataFrame, climate_key: str, fert_types: Iterable[str]) -> pd.DataFrame:
+    """Emission factor rows of `df` for one climate and the given fertiliser types."""
+    if not {"emission_factor", "climate_type", "fert_type"} <= set(df.columns):
+        return df.iloc[0:0]
+    selected = (df["climate_type"] == climate_key) & df["fert_type"].isin(list(fert_types))
+    return df[selected & df["emission_factor"].notna()]
+
+
+class EmissionFactorResolver:
+    """Emission factor rows per (product, climate, fertiliser types), shared by all runs.
+
+    Entries belong to one datastore build: resolving with another `build_id`
+    drops them. Lookups and updates are guarded by a lock, the rows of a miss
+    are computed outside of it."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._rows = OrderedDict()
+        self._build_id = None
+        self._lock = threading.Lock()
+
+    def resolve(
+        self,
+        product_IRI,
+        climate_key: str,
+        fert_types: Iterable[str],
+        build_id: Optional[str],
+        candidates: Callable[[], Iterable[pd.DataFrame]],
+    ) -> pd.DataFrame:
+        """Rows from the first of `candidates()` that has any, e.g. exact match then broader.
+
+        `candidates` is only called on a cache miss, so expensive frames can be
+        built lazily by a generator."""
+        key = (str(product_IRI), climate_key, frozenset(fert_types))
+        with self._lock:
+            if build_id != self._build_id:
+                self._rows.clear()
+                self._build_id = build_id
+            rows = self._rows.get(key)
+            if rows is not None:
+                self._rows.move_to_end(key)
+        if rows is not None:
+            instrumentation.count("ef_cache_hits")
+            return rows.copy()
+
+        instrumentation.count("ef_cache_misses")
+        rows = None
+        for frame in candidates():
+            rows = select_factors(frame, climate_key, key[2])
+            if len(rows):
+                break
+        if rows is None or not len(rows):
+            rows = pd.DataFrame(columns=FACTOR_COLUMNS)
+        rows = rows.reset_index(drop=True)
+        with self._lock:
+            if build_id == self._build_id:
+                self._rows[key] = rows
+                if len(self._rows) > self.maxsize:
+                    self._rows.popitem(last=False)
+        return rows.copy()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+
+
+@lru_cache(maxsize=1)
+def emission_factor_resolver() -> EmissionFactorResolver:
+    return EmissionFactorResolver()
+
+
 def get_emission_factors(
-    product_IRI: ProductIRI,
+    product_IRI: "ProductIRI",
     climate_key = 'default',
 ):
-    #read
-    df_emission_factors = pd.read_csv("../docs/EF.csv", sep=';')
-    #format
-    df_emission_factors_formatted = fct.format_df(df_emission_factors, ['crop_iri','fert_iri'])
-    unique_IRI_crop = list(pd.unique(df_emission_factors_formatted['crop_iri']))
-    crop_match_IRI = fct.find_match_IRI(product_IRI, unique_IRI_crop)
-    
-    #filter
-    emission_factors_filtered = df_emission_factors[df_emission_factors['climate_type'] == climate_key]
-    emission_factors_filtered = emission_factors_filtered[emission_factors_filtered['crop_iri'] == crop_match_IRI]
+    store = emission_factor_store()
+    crop_match_IRI = store.match(product_IRI)
+    return store.factors(crop_match_IRI, climate_key)
+
+def n2o_emission(N_total, emission_factor, out: np.ndarray = None):
+    """N2O emission `(28+16)/28 * N_total * emission_factor`, element-wise.
+
+    `N_total` can be a scalar or one value per row, it is broadcast against
+    `emission_factor` (array or Series). If `out` is given the result is written
+    into that preallocated array and returned, without allocating a new one."""
+    result = np.multiply(np.asarray(N_total, dtype=float), np.asarray(emission_factor, dtype=float), out=out)
+    result *= N2O_N_TO_N2O
+    if out is None and isinstance(emission_factor, pd.Series):
+        return pd.Series(result, index=emission_factor.index, name=emission_factor.name)
+    return result
 
-    return emission_factors_filtered
 
 def get_emission(emission_factor : pd.DataFrame(), N_total:float):
-    emission_factor['emission [kg_N20/ha]'] = emission_factor.apply(lambda x : x['emission_factor']*(28+16)/28*N_total , axis = 1)
-    return emission_factor
+    return emission_factor.assign(
+        **{'emission [kg_N20/ha]': n2o_emission(N_total, emission_factor['emission_factor'].to_numpy())}
+    )
 
 
-def _run(product_IRI: ProductIRI, N_total: float, climate_key: str = None):
-    #emission_factors = get_emission_factors(product_IRI, climate_key)
-    #df_emission = get_emission(emission_factors, N_total)
+def _run(product_IRI: "ProductIRI", N_total: float, climate_key: str = None):
+    emission_factors = get_emission_factors(product_IRI, climate_key or 'default')
+    df_emission = get_emission(emission_factors, N_total)
     
-    logging.info(df_emission)
+    logging.debug("Emissions for %s: %s rows", product_IRI, len(df_emission))
     return df_emission #only for testing 
 
-def run(product_IRI: ProductIRI, fertilizer_n_per_ha, climate_key: str = None):
+def run(product_IRI: "ProductIRI", fertilizer_n_per_ha, climate_key: str = None):
     return _run(product_IRI, fertilizer_n_per_ha, climate_key)
\ No newline at end of file
@@ -1,6 +1,8 @@
 # Adapted from HESTIA https://gitlab.com/hestia-earth/hestia-engine-models/-/blob/develop/hestia_earth/models/ipcc2019/n2OToAirInorganicFertiliserDirect.py?ref_type=heads
 from enum import Enum
 
+import numpy as np
+
 class TermTermType(Enum):
     INORGANICFERTILISER = 1
     ORGANICFERTILISER = 2
@@ -62,6 +64,43 @@ def get_N2O_factors(
 
 
 
+# rows of `FACTOR_TABLE`, columns are `TermTermType.value - 1`
+CLIMATES = ("dry", "wet", "default", "flooded_rice")
+FACTOR_FIELDS = ("value", "min", "max", "sd")
+FACTOR_DTYPE = np.dtype([(field, np.float64) for field in FACTOR_FIELDS])
+N2O_N_TO_N2O = (28+16)/28
+
+
+def compile_factors(factors: dict = N2O_FACTORS) -> np.ndarray:
+    """`factors` as a structured array of shape (climates, term types)."""
+    table = np.zeros((len(CLIMATES), len(TermTermType)), dtype=FACTOR_DTYPE)
+    for i, climate in enumerate(CLIMATES):
+        for term_type in TermTermType:
+            entry = factors[climate].get(term_type, factors[climate])
+            sd = (entry['max'] - entry['min'])/4
+            table[i, term_type.value - 1] = (entry['value'], entry['min'], entry['max'], sd)
+    return table
+
+
+FACTOR_TABLE = compile_factors()
+
+
+def climate_codes(wet_climate) -> np.ndarray:
+    """Rows of `FACTOR_TABLE` for "wet"/"dry"/None, chosen like `ecoClimate_factors`."""
+    is_wet = np.asarray(wet_climate, dtype=object) == "wet"
+    return np.where(is_wet, CLIMATES.index("wet"), CLIMATES.index("dry"))
+
+
+def run_batch(N_total, climate_code, term_type: TermTermType = TermTermType.INORGANICFERTILISER) -> dict:
+    """Emissions for arrays of N totals and `FACTOR_TABLE` climate codes.
+
+    Returns one array per field of `FACTOR_FIELDS`, computed without building
+    a dict per input."""
+    converted_N_total = np.asarray(N_total, dtype=float) * N2O_N_TO_N2O
+    factors = FACTOR_TABLE[np.asarray(climate_code, dtype=np.intp), term_type.value - 1]
+    return {field: converted_N_total * factors[field] for field in FACTOR_FIELDS}
+
+
 def _emission(value: float, min: float, max: float, sd: float, aggregated: bool = False):
     emission = {}
     emission['value'] = [value]
@@ -73,16 +112,8 @@ def _emission(value: float, min: float, max: float, sd: float, aggregated: bool
 
 
 def _run(N_total: float, wet_climate: str = None):
-    converted_N_total = N_total * (28+16)/28
-    factors, aggregated = get_N2O_factors(
-        TermTermType.INORGANICFERTILISER, wet_climate=wet_climate
-    )
-
-    value = converted_N_total * factors['value']
-    min = converted_N_total * factors['min']
-    max = converted_N_total * factors['max']
-    sd = converted_N_total * (factors['max'] - factors['min'])/4
-    return [_emission(value, min, max, sd, aggregated=aggregated)]
+    emission = run_batch(N_total, climate_codes(wet_climate))
+    return [_emission(*(float(emission[field]) for field in FACTOR_FIELDS), aggregated=wet_climate is None)]
 
 # wet_climate = "wet", "dry", None
 def run(fertilizer_n_per_ha, wet_climate: str):
@@ -0,0 +1,162 @@
+#Batch computation of N2O emissions for many demands at once
+import functools
+import logging
+from concurrent.futures import Executor
+from typing import Optional, Union
+
+import pandas as pd
+
+import connections
+import create_data
+import DirectFertiliserEmission as dfe
+import function as fct
+import instrumentation
+from instrumentation import in_executor
+import uncertainty
+from lazy import lazy_import
+
+sdt = lazy_import("sentier_data_tools")
+
+DATE_COLUMN = create_data.fertiliser_COLUMNS[1]
+TABLE_COLUMNS = {
+    # name: (dataset kind name, value column IRI)
+    "fertiliser_input": ("BOM", create_data.fertiliser_COLUMNS[2]),
+    "crop_yield": ("PARAMETERS", create_data.yield_COLUMNS[2]),
+    "emission_factor": ("PARAMETERS", create_data.ef_COLUMNS[3]),
+}
+INORGANIC_FERT_TYPES = list(dfe.INORGANIC_FERT_TYPES)
+
+
+def stored_frames(kind: str, snapshot=None):
+    """`(product, location, dataframe)` of every dataset of `kind`, from the datastore or a `snapshot.Snapshot`."""
+    kind = sdt.DatasetKind[kind]
+    if snapshot is not None:
+        for entry, df in snapshot.frames(kind):
+            yield entry["product"], entry["location"], df
+        return
+    instrumentation.count("db_queries")
+    for dataset in connections.bind(sdt.Dataset.select().where(sdt.Dataset.kind == kind)):
+        yield str(dataset.product), str(dataset.location), dataset.dataframe
+
+
+def load_tables(snapshot=None) -> dict[str, pd.DataFrame]:
+    """Read every fertiliser, yield and emission factor dataset into one long table each.
+
+    The tables carry the dataset `product` and `location` as columns, so demands
+    can be resolved with joins instead of one query per demand. With a
+    `snapshot.Snapshot` the datasets are read from its Parquet partitions
+    instead of the datastore."""
+    tables = {}
+    for name, (kind, column) in TABLE_COLUMNS.items():
+        frames = []
+        for product, location, df in stored_frames(kind, snapshot):
+            if column not in df.columns:
+                continue
+            frames.append(
+                df.rename(columns={column: name, DATE_COLUMN: "year"}).assign(
+                    product=product, location=location
+                )
+            )
+        tables[name] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=["product", "location", "year", name]
+        )
+    tables["fertiliser_input"] = first_per_key(tables["fertiliser_input"], "fertiliser_input")
+    tables["crop_yield"] = first_per_key(tables["crop_yield"], "crop_yield")
+    return tables
+
+
+def first_per_key(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    # same choice as `Crop.select_right_value_from_df(strategy="first")`
+    df = df[["product", "location", "year", column]].dropna(subset=[column])
+    df["year"] = df["year"].astype(str)
+    return df.drop_duplicates(["product", "location", "year"], keep="first")
+
+
+def demands_frame(demands: Union[pd.DataFrame, list]) -> pd.DataFrame:
+    """Normalise a list of `UserInput` or a dataframe with the same fields."""
+    if isinstance(demands, pd.DataFrame):
+        df = demands.reset_index(drop=True).copy()
+    else:
+        df = pd.DataFrame([demand.model_dump() for demand in demands])
+    for column in ("fertilizer_amount", "crop_yield_val", "climate_type"):
+        if column not in df.columns:
+            df[column] = None
+    if "year" not in df.columns:
+        df["year"] = "2018"
+    df["product_iri"] = df["product_iri"].astype(str)
+    df["spatial_context"] = df["spatial_context"].astype(str)
+    df["year"] = df["year"].astype(str)
+    df["climate_key"] = df["climate_type"].fillna("default")
+    df["fertilizer_amount"] = df["fertilizer_amount"].astype(float)
+    df["crop_yield_val"] = df["crop_yield_val"].astype(float)
+    df.index.name = "demand"
+    return df.reset_index()
+
+
+def run_batch(
+    demands: Union[pd.DataFrame, list], tables: Optional[dict] = None, run_config=None
+) -> pd.DataFrame:
+    """N2O emissions from mineral fertiliser for many demands in one pass.
+
+    Returns one row per demand and emission factor `value_type`, with the same
+    columns as `Crop.get_emissions` plus the demand index. Explicit
+    `fertilizer_amount`/`crop_yield_val` on a demand override the datastore.
+    With a `run_config` whose `num_samples` is positive, Monte Carlo percentiles
+    (see `uncertainty.emission_percentiles`) are joined on every row."""
+    if tables is None:
+        tables = load_tables()
+    df = demands_frame(demands)
+
+    fertiliser = tables["fertiliser_input"].rename(
+        columns={"product": "product_iri", "location": "spatial_context"}
+    )
+    df = df.merge(fertiliser, on=["product_iri", "spatial_context", "year"], how="left")
+    df["fertiliser_input"] = df["fertilizer_amount"].fillna(df["fertiliser_input"])
+
+    crop_yield = tables["crop_yield"].rename(
+        columns={"product": "product_iri", "location": "spatial_context"}
+    )
+    df = df.merge(crop_yield, on=["product_iri", "spatial_context", "year"], how="left")
+    df["crop_yield"] = df["crop_yield_val"].fillna(df["crop_yield"])
+
+    factors = tables["emission_factor"]
+    factors = factors[factors["fert_type"].isin(INORGANIC_FERT_TYPES)]
+    matcher = fct.iri_matcher(frozenset(factors["product"].unique()))
+    df["ef_product"] = matcher.match_many(df["product_iri"])
+    df = df.merge(
+        factors[["product", "climate_type", "fert_type", "value_type", "emission_factor"]],
+        left_on=["ef_product", "climate_key"],
+        right_on=["product", "climate_type"],
+        how="left",
+        suffixes=("_demand", ""),
+    ).drop(columns=["product", "climate_type"]).rename(columns={"climate_type_demand": "climate_type"})
+
+    missing = df.loc[df["fertiliser_input"].isna() | df["emission_factor"].isna(), "demand"].unique()
+    if len(missing):
+        logging.warning("No fertiliser amount or emission factor for %d demands", len(missing))
+
+    n2o = dfe.n2o_emission(df["fertiliser_input"].to_numpy(dtype=float), df["emission_factor"].to_numpy(dtype=float))
+    df["N2O emission"] = n2o
+    df["N2O emission per ha"] = n2o * dfe.M2_PER_HA
+    df = df.drop(columns=["fertilizer_amount", "crop_yield_val"])
+
+    if run_config is not None and run_config.num_samples > 0:
+        sampled = uncertainty.emission_percentiles(
+            df.dropna(subset=["emission_factor"]),
+            num_samples=run_config.num_samples,
+            rng=getattr(run_config, "seed", None),
+        )
+        df = df.merge(sampled, left_on="demand", right_index=True, how="left")
+    return df
+
+
+async def arun_batch(
+    demands: Union[pd.DataFrame, list],
+    tables: Optional[dict] = None,
+    run_config=None,
+    executor: Optional[Executor] = None,
+) -> pd.DataFrame:
+    """`run_batch` on `executor`, for callers running an event loop."""
+    if tables is None:
+        tables = await in_executor(executor, load_tables)
+    return await in_executor(executor, functools.partial(run_batch, demands, tables, run_config))
@@ -0,0 +1,110 @@
+#Pooled read-only connections and a single writer for the local datastore
+import os
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from pathlib import Path
+
+from playhouse.pool import PooledSqliteExtDatabase
+
+# read-only connections kept per database file
+POOL_SIZE = int(os.environ.get("AGRIPEEPS_READ_POOL", 8))
+# seconds to wait for a free pooled connection
+POOL_TIMEOUT = 30
+
+# read pool of the running `reading` block
+_reader: ContextVar = ContextVar("agripeeps_reader", default=None)
+# one build at a time per process, SQLite has a single writer anyway
+_write_lock = threading.RLock()
+# callbacks waiting for the outermost `writing` block of this thread to commit
+_state = threading.local()
+
+
+def writer():
+    """The database `Dataset` is bound to, all writes go through it."""
+    from sentier_data_tools.local_storage.db import Dataset
+
+    return Dataset._meta.database
+
+
+def enable_wal(database) -> None:
+    # stored in the database file; readers then keep seeing the last commit while a build writes
+    if not database.in_transaction():
+        database.execute_sql("PRAGMA journal_mode=wal")
+
+
+@lru_cache(maxsize=None)
+def read_pool(path: str) -> PooledSqliteExtDatabase:
+    """Pool of read-only connections to the SQLite file at `path`, switched to WAL first."""
+    with closing(sqlite3.connect(path)) as connection:
+        connection.execute("PRAGMA journal_mode=wal")
+    return PooledSqliteExtDatabase(
+        f"{Path(path).resolve().as_uri()}?mode=ro",
+        uri=True,
+        max_connections=POOL_SIZE,
+        timeout=POOL_TIMEOUT,
+        check_same_thread=False,
+        pragmas={"query_only": 1},
+    )
+
+
+@contextmanager
+def reading():
+    """Send the queries of this block (see `bind`) to one pooled read-only connection.
+
+    The block is one read transaction, so in WAL mode it sees the datastore as
+    of its first query, whatever a concurrent build commits meanwhile. Blocks
+    in other threads use other connections of the pool."""
+    if _reader.get() is not None:
+        yield _reader.get()
+        return
+    pool = read_pool(str(writer().database))
+    with pool.connection_context(), pool.atomic():
+        token = _reader.set(pool)
+        try:
+            yield pool
+        finally:
+            _reader.reset(token)
+
+
+def bind(query):
+    """`query` on the connection of the running `reading` block, or unchanged outside of one."""
+    pool = _reader.get()
+    return query if pool is None else query.bind(pool)
+
+
+@contextmanager
+def writing():
+    """Run the writes of this block as one transaction of the writer.
+
+    Builds are serialized by a process-wide lock; readers are not blocked and
+    see either the content before the block or all of it."""
+    database = writer()
+    with _write_lock:
+        enable_wal(database)
+        callbacks = getattr(_state, "after_commit", None)
+        outer = callbacks is None
+        if outer:
+            _state.after_commit = callbacks = []
+        try:
+            with database.atomic():
+                yield database
+        finally:
+            if outer:
+                _state.after_commit = None
+        if outer:
+            for callback in callbacks:
+                callback()
+
+
+def after_commit(callback) -> None:
+    """Run `callback` once the running `writing` block commits, right away outside of one.
+
+    Callbacks of a block that rolls back are dropped."""
+    callbacks = getattr(_state, "after_commit", None)
+    if callbacks is None:
+        callback()
+    elif callback not in callbacks:
+        callbacks.append(callback)
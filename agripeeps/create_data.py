@@ -1,45 +1,162 @@
+import time
+from collections import defaultdict
 from datetime import date
-from pathlib import Path
-
-import warnings
-warnings.filterwarnings("ignore")
+from typing import Optional
 
 import pandas as pd
 from loguru import logger
-import function as fct
+import DirectFertiliserEmission as dfe
+
+import connections
+import ingest
+import instrumentation
+import resolve
+import sources
+from lazy import lazy_import
+from manifest import BuildManifest, dataset_key, file_checksum, frame_checksum, stored_dataset_ids
 
-import faostat
-import country_converter as coco
+sdt = lazy_import("sentier_data_tools")
 
-import sentier_data_tools as sdt
+EF_PATH = dfe.EF_PATH
+# sources downloaded through `sources`, checked again once older than `sources.MAX_AGE`
+REMOTE_SOURCES = ("yield", "fertiliser")
 
-df_lookup_geonameid = pd.read_csv("geonames.tsv", sep='\t')
-lookup_geonameid = df_lookup_geonameid[["ISO3", "geonameid"]].set_index("ISO3").to_dict()['geonameid']
 years = []
 
 def reset_db():
     sdt.reset_local_database()
 
+
+def build_local_datastorage(refresh: bool = False, rebuild: bool = False) -> BuildManifest:
+    """Bring the local datastore up to date with the FAO, FUBC and IPCC sources.
+
+    Without `refresh` an existing complete build is reused while it is current
+    (see `is_current`), otherwise the sources are checked (see `sources`). With
+    `refresh` they are revalidated regardless of their age. Only the
+    crop/country datasets whose content changed are rewritten. `rebuild` wipes
+    the database and starts from scratch.
+
+    The build is one transaction of `connections.writing`, so queries of
+    `connections.reading` blocks never see it half done.
+    """
+    with connections.writing():
+        manifest = BuildManifest.load()
+        if rebuild:
+            reset_db()
+            manifest = BuildManifest(manifest.path)
+        elif not refresh and manifest.is_complete() and is_current(manifest):
+            instrumentation.count("datastore_reused")
+            logger.info("Reusing local datastore build {}", manifest.build_id)
+            return manifest
+
+        create_yield_local_datastorage(manifest, refresh=refresh)
+        create_fertiliser_local_datastorage(manifest, refresh=refresh)
+        create_emissionfactors_local_datastorage(manifest)
+    logger.info("Local datastore build {}", manifest.build_id)
+    return manifest
+
+
+def is_current(manifest: BuildManifest) -> bool:
+    """True if the local emission factor table is unchanged and the remote sources were checked within `sources.MAX_AGE`."""
+    if manifest.sources["emission_factors"]["checksum"] != file_checksum(EF_PATH):
+        return False
+    return all(time.time() - manifest.sources[source].get("checked", 0) < sources.MAX_AGE for source in REMOTE_SOURCES)
+
+
+class DatasetWriter:
+    """Collects the datasets of one source and writes the changed ones in bulk.
+
+    Datasets whose content matches the manifest are skipped, changed ones replace
+    the stored version, and datasets of the source that were not added again are
+    deleted on `flush`. A new dataset also replaces stored rows of the same kind,
+    product and location that no manifest entry records, e.g. of a store built
+    before the manifest existed or whose manifest was lost."""
+
+    def __init__(self, manifest: BuildManifest, source: str, existing_ids: set):
+        self.manifest = manifest
+        self.source = source
+        self.existing_ids = existing_ids
+        self.seen = set()
+        self.pending = []
+        self._untracked = None
+
+    def untracked_ids(self, kind, product, location) -> list:
+        if self._untracked is None:
+            tracked = {entry["id"] for entry in self.manifest.datasets.values()}
+            self._untracked = defaultdict(list)
+            Dataset = sdt.Dataset
+            for row in Dataset.select(Dataset.id, Dataset.kind, Dataset.product, Dataset.location):
+                if row.id not in tracked:
+                    self._untracked[(row.kind, str(row.product), str(row.location))].append(row.id)
+        return self._untracked.pop((kind, str(product), str(location)), [])
+
+    def add(self, **kwargs) -> None:
+        key = dataset_key(self.source, str(kwargs["product"]), str(kwargs["location"]))
+        self.seen.add(key)
+        checksum = frame_checksum(kwargs["dataframe"])
+        entry = self.manifest.datasets.get(key)
+        if entry and entry["checksum"] == checksum and entry["id"] in self.existing_ids:
+            return
+        if entry:
+            sdt.Dataset.delete_by_id(entry["id"])
+        else:
+            untracked = self.untracked_ids(kwargs["kind"], kwargs["product"], kwargs["location"])
+            if untracked:
+                sdt.Dataset.delete().where(sdt.Dataset.id << untracked).execute()
+        version = entry["version"] + 1 if entry else 1
+        self.pending.append((key, checksum, dict(kwargs, version=version)))
+
+    def flush(self, batch_size: int = ingest.BATCH_SIZE, workers: Optional[int] = ingest.WORKERS) -> int:
+        """Insert the pending datasets, returns how many were written."""
+        ids = ingest.bulk_insert([record for _, _, record in self.pending], batch_size, workers)
+        for (key, checksum, record), dataset_id in zip(self.pending, ids):
+            self.manifest.datasets[key] = {"checksum": checksum, "version": record["version"], "id": dataset_id}
+        for key in self.manifest.source_keys(self.source) - self.seen:
+            sdt.Dataset.delete_by_id(self.manifest.datasets.pop(key)["id"])
+        written, self.pending = len(self.pending), []
+        return written
+
+
+def local_database():
+    # the database `sdt.Dataset` is currently bound to
+    return sdt.Dataset._meta.database
+
+
+def crop_country_groups(df: pd.DataFrame, columns: list):
+    """`(crop, country, rows)` for every crop and country that has data, in one groupby pass."""
+    for (crop, country), group in df.groupby(["CropIRI", "Country"], sort=False, observed=True):
+        yield crop, country, group[columns]
+
+
         
-def create_mineral_fertilizer_data():
+def create_mineral_fertilizer_data(refresh: bool = False):
     
-    df_fertiliser = pd.read_csv("https://raw.githubusercontent.com/ludemannc/FUBC_1_to_9_2022/refs/heads/main/results/FUBC_1_to_9_data.csv")
+    df_fertiliser = sources.fetch_csv("fubc", sources.FUBC_URL, refresh=refresh)
     crops = ['Rice', 'Wheat', 'Maize', 'Potatoes']
     df_fertiliser['N_t_ha'] = df_fertiliser['N_k_t'] / df_fertiliser['Crop_area_k_ha']    
     df_fertiliser = df_fertiliser.query("Crop in @crops")
     df_fertiliser = df_fertiliser[['Crop', 'Year', 'ISO3_code', 'N_t_ha']]
     df_fertiliser["Year"] = df_fertiliser["Year"].str[0:4]
-    df_fertiliser["Country"] = df_fertiliser.ISO3_code.apply(lambda code: "https://sws.geonames.org/" + str(lookup_geonameid[code]))
-    df_fertiliser['CropIRI'] = df_fertiliser.Crop.apply(lambda name: crop_IRIs[name])
+    df_fertiliser["Country"] = resolve.country_iris(df_fertiliser["ISO3_code"])
+    df_fertiliser['CropIRI'] = resolve.crop_iris(df_fertiliser["Crop"])
+    df_fertiliser = df_fertiliser.dropna(subset=["Country", "CropIRI"])
     df_fertiliser['N_kg_m2'] = df_fertiliser['N_t_ha'] * 1000 / 10000    
     years = df_fertiliser["Year"].str[0:4].unique()
     df_fertiliser = df_fertiliser[["Year", "Country", "CropIRI", "N_kg_m2"]]
     df_fertiliser["Datasource"] = "FAO"
     return df_fertiliser
 
-def create_fertiliser_local_datastorage():
-        
-    fertiliser = create_mineral_fertilizer_data()
+def create_fertiliser_local_datastorage(manifest: Optional[BuildManifest] = None, refresh: bool = False):
+    manifest = manifest or BuildManifest.load()
+    existing_ids = stored_dataset_ids()
+
+    fertiliser = create_mineral_fertilizer_data(refresh=refresh)
+    checksum = frame_checksum(fertiliser)
+    if manifest.source_unchanged("fertiliser", checksum, existing_ids):
+        logger.info("Fertiliser data unchanged, keeping stored datasets")
+        manifest.set_source("fertiliser", checksum, checked=time.time())
+        manifest.save()
+        return
 
     metadata = sdt.Datapackage(
         name="agricultural fertiliser input data from FUBC",
@@ -61,11 +178,11 @@ def create_fertiliser_local_datastorage():
     metadata.pop("version")
 
     #display(fertiliser)
-    for crop in fertiliser.CropIRI.unique():
-        for country in fertiliser.Country.unique():
-            df = fertiliser.query(f"CropIRI == @crop and Country == @country")[["Datasource", "Year", "N_kg_m2"]]
+    writer = DatasetWriter(manifest, "fertiliser", existing_ids)
+    with local_database().atomic():
+        for crop, country, df in crop_country_groups(fertiliser, ["Datasource", "Year", "N_kg_m2"]):
             df = df.set_axis(fertiliser_COLUMNS, axis=1)
-            sdt.Dataset( 
+            writer.add(
                     name=f"fertiliser input on fields for {crop} in {country}",
                     dataframe=df,
                     product=crop,
@@ -73,46 +190,39 @@ def create_fertiliser_local_datastorage():
                     metadata=metadata,
                     kind=sdt.DatasetKind.BOM,
                     location=country,
-                    version=1,
                     valid_from=date(2000, 1, 1),
                     valid_to=date(2030, 12, 31),
-                ).save()
+                )
+        written = writer.flush()
+    manifest.set_source("fertiliser", checksum, checked=time.time())
+    manifest.save()
+    logger.info("Wrote {} of {} fertiliser datasets", written, len(writer.seen))
 
 
-def create_crop_yields_data():
+def create_crop_yields_data(refresh: bool = False):
     crops = ['Rice', 'Wheat', 'Maize (corn)', 'Potatoes']
     data = get_FAO_data(
             dataset_code="QCL",
             element="Yield",
             items=crops,
             list_year=years,
+            refresh=refresh,
         )
-    cc = coco.CountryConverter()
-    data["ISO3"] = cc.pandas_convert(series=data["Area Code"], src="FAOcode", to='ISO3')
-    data = data.query("ISO3 != 'not found'")
-    data = data[["ISO3", "Item", "Year", "Value"]]
+    data = data[["Area Code", "Item", "Year", "Value"]]
     data["Value"] = data["Value"].astype("float")/10/10000 #convert from 100g/ha to kg/m2    
-    data["Country"] = data.ISO3.apply(lambda code: "https://sws.geonames.org/" + str(lookup_geonameid[code]))
-    data['CropIRI'] = data.Item.apply(lambda name: crop_IRIs[name])   
+    data["Country"] = resolve.fao_country_iris(data["Area Code"])
+    data['CropIRI'] = resolve.crop_iris(data["Item"])
+    data = data.dropna(subset=["Country", "CropIRI"])
     data["Datasource"] = "FAO"
     data = data[["Datasource", "Year", "Country", "CropIRI", "Value"]]  
     return data
 
-def get_FAO_data(dataset_code, element, items, list_year):
-    element_values = faostat.get_par(dataset_code, "element")
-    element_number = element_values[element]
-    item_values = faostat.get_par(dataset_code, "items")
-    items_number = [item_values[item] for item in items]
-    data = faostat.get_data_df(
-        dataset_code,
-        pars={"element": element_number,
-              "item": items_number,
-              "year": list_year},
-        coding={"area_cs": "ISO3"}
-    )
-    return data
+def get_FAO_data(dataset_code, element, items, list_year, refresh=False):
+    return sources.fetch_faostat(dataset_code, element, items, list_year, refresh=refresh)
 
-def create_yield_local_datastorage():
+def create_yield_local_datastorage(manifest: Optional[BuildManifest] = None, refresh: bool = False):
+    manifest = manifest or BuildManifest.load()
+    existing_ids = stored_dataset_ids()
 
     metadata = sdt.Datapackage(
         name="crop yield from FAO",
@@ -133,13 +243,19 @@ def create_yield_local_datastorage():
     ).metadata()
     metadata.pop("version")
 
-    crop_yields = create_crop_yields_data()
-    for crop in crop_yields.CropIRI.unique():
-        for country in crop_yields.Country.unique():
-            df = crop_yields.query(f"CropIRI == @crop and Country == @country")[["Datasource", "Year", "Value"]]
-            df = df.set_axis(yield_COLUMNS, axis=1)
+    crop_yields = create_crop_yields_data(refresh=refresh)
+    checksum = frame_checksum(crop_yields)
+    if manifest.source_unchanged("yield", checksum, existing_ids):
+        logger.info("Crop yield data unchanged, keeping stored datasets")
+        manifest.set_source("yield", checksum, checked=time.time())
+        manifest.save()
+        return
 
-            sdt.Dataset(
+    writer = DatasetWriter(manifest, "yield", existing_ids)
+    with local_database().atomic():
+        for crop, country, df in crop_country_groups(crop_yields, ["Datasource", "Year", "Value"]):
+            df = df.set_axis(yield_COLUMNS, axis=1)
+            writer.add(
                     name=f"crop yields",
                     dataframe=df,
                     product=crop,
@@ -147,13 +263,21 @@ def create_yield_local_datastorage():
                     metadata=metadata,
                     kind=sdt.DatasetKind.PARAMETERS,
                     location=country,
-                    version=1,
                     valid_from=date(2000, 1, 1),
                     valid_to=date(2028, 1, 1),
-                ).save()
-
-def create_emissionfactors_local_datastorage():
+                )
+        written = writer.flush()
+    manifest.set_source("yield", checksum, checked=time.time())
+    manifest.save()
+    logger.info("Wrote {} of {} crop yield datasets", written, len(writer.seen))
 
+def create_emissionfactors_local_datastorage(manifest: Optional[BuildManifest] = None):
+    manifest = manifest or BuildManifest.load()
+    existing_ids = stored_dataset_ids()
+    checksum = file_checksum(EF_PATH)
+    if manifest.source_unchanged("emission_factors", checksum, existing_ids):
+        logger.info("Emission factors unchanged, keeping stored datasets")
+        return
 
     metadata = sdt.Datapackage(
         name="N2O emission factors",
@@ -173,37 +297,36 @@ def create_emissionfactors_local_datastorage():
         homepage="https://ipcc.org/",
     ).metadata()
     metadata.pop("version")
-    df_emission_factors = pd.read_csv("../docs/EF.csv", sep=';')
-    df = fct.format_df(df_emission_factors, ['crop_iri','fert_iri'])
-    df = df.drop("fert_iri",axis=1)
-    for crop in df.crop_iri.unique():
-        df_filt = df.query("crop_iri == @crop").drop("crop_iri",axis=1)
-        df_filt = df_filt.set_axis(ef_COLUMNS, axis=1)
-
-        sdt.Dataset(
-                name=f"N2O emission factors from IPCC",
-                dataframe=df_filt,
-                product=crop,
-                columns=[{"iri": x, "unit": y} for x, y in zip(ef_COLUMNS, ef_UNITS)],
-                metadata=metadata,
-                kind=sdt.DatasetKind.PARAMETERS,
-                location="https://sws.geonames.org/6295630/",
-                version=1,
-                valid_from=date(2000, 1, 1),
-                valid_to=date(2028, 1, 1),
-            ).save()
+    # read from `EF_PATH` again, the file changed since `dfe.emission_factor_store` was cached
+    store = dfe.EmissionFactorStore.from_csv(EF_PATH)
+    dfe.emission_factor_store.cache_clear()
+    writer = DatasetWriter(manifest, "emission_factors", existing_ids)
+    with local_database().atomic():
+        for crop in store.table.index.unique("crop_iri"):
+            df_filt = store.factors(crop)[["climate_type", "fert_type", "value_type", "emission_factor"]]
+            df_filt = df_filt.astype({column: str for column in dfe.EF_CATEGORIES}).reset_index(drop=True)
+            df_filt = df_filt.set_axis(ef_COLUMNS, axis=1)
+
+            writer.add(
+                    name=f"N2O emission factors from IPCC",
+                    dataframe=df_filt,
+                    product=crop,
+                    columns=[{"iri": x, "unit": y} for x, y in zip(ef_COLUMNS, ef_UNITS)],
+                    metadata=metadata,
+                    kind=sdt.DatasetKind.PARAMETERS,
+                    location=GLOBAL_LOCATION,
+                    valid_from=date(2000, 1, 1),
+                    valid_to=date(2028, 1, 1),
+                )
+        writer.flush()
+    manifest.set_source("emission_factors", checksum)
+    manifest.save()
 
 crop_IRI = "http://data.europa.eu/xsp/cn2024/060011000090"
 geo_IRI = "http://purl.org/dc/terms/Location"
+GLOBAL_LOCATION = "https://sws.geonames.org/6295630/"
 
-crop_IRIs = {
-    "Wheat": "http://data.europa.eu/xsp/cn2024/100100000080",
-    "Rice": "http://aims.fao.org/aos/agrovoc/c_6599",	
-    "Potatoe": "http://data.europa.eu/xsp/cn2024/071010000080",
-    "Potatoes": "http://data.europa.eu/xsp/cn2024/071010000080",
-    "Maize": "http://data.europa.eu/xsp/cn2024/100500000080",
-    "Maize (corn)": "http://data.europa.eu/xsp/cn2024/100500000080"
-}
+crop_IRIs = resolve.CROP_IRIS
 
 ef_COLUMNS = [
     "climate_type",
@@ -0,0 +1,97 @@
+#Registry of the emission pathways evaluated by `Crop`
+from typing import Callable, Iterable, Optional
+
+import pandas as pd
+
+import DirectFertiliserEmission as dfe
+
+# inputs a model can ask for, looked up in `input_index` unless given in the demand
+VALUES = ("fertiliser_input", "crop_yield")
+
+
+class EmissionModel:
+    """One emission pathway and the inputs it needs.
+
+    `values` name inputs of `VALUES`, `fert_types` asks for the emission factor
+    rows of those fertiliser types. `compute` receives a dict with every value
+    and, under `emission_factor`, the factor rows, and returns the emission
+    rows. With `uncertainty` set the rows are in the layout of
+    `uncertainty.emission_percentiles` and get Monte Carlo percentiles."""
+
+    def __init__(
+        self,
+        name: str,
+        compute: Callable[[dict], pd.DataFrame],
+        values: Iterable[str] = (),
+        fert_types: Optional[Iterable[str]] = None,
+        uncertainty: bool = False,
+    ):
+        unknown = set(values) - set(VALUES)
+        if unknown:
+            raise ValueError(f"Unknown inputs {sorted(unknown)} of emission model {name}")
+        self.name = name
+        self.compute = compute
+        self.values = tuple(values)
+        self.fert_types = None if fert_types is None else tuple(fert_types)
+        self.uncertainty = uncertainty
+
+    def __repr__(self):
+        return f"EmissionModel({self.name!r})"
+
+
+EMISSION_MODELS: dict[str, EmissionModel] = {}
+
+
+def register(model: EmissionModel, replace: bool = False) -> EmissionModel:
+    if model.name in EMISSION_MODELS and not replace:
+        raise ValueError(f"Emission model {model.name} is already registered")
+    EMISSION_MODELS[model.name] = model
+    return model
+
+
+def emission_model(name: str, **needs):
+    """Register the decorated `compute` function as emission model `name`."""
+
+    def decorator(compute):
+        register(EmissionModel(name, compute, **needs))
+        return compute
+
+    return decorator
+
+
+def get_models(names: Iterable[str]) -> list[EmissionModel]:
+    missing = [name for name in names if name not in EMISSION_MODELS]
+    if missing:
+        raise KeyError(f"Unknown emission models {missing}, registered: {sorted(EMISSION_MODELS)}")
+    return [EMISSION_MODELS[name] for name in names]
+
+
+def needed_values(models: Iterable[EmissionModel]) -> list[str]:
+    """Union of the values of `models`, each once and in `VALUES` order."""
+    needed = {name for model in models for name in model.values}
+    return [name for name in VALUES if name in needed]
+
+
+def needed_fert_types(models: Iterable[EmissionModel]) -> list[tuple]:
+    """Distinct fertiliser type sets of `models`, each resolved once."""
+    found = {}
+    for model in models:
+        if model.fert_types is not None:
+            found.setdefault(frozenset(model.fert_types), model.fert_types)
+    return list(found.values())
+
+
+# yield is only used by the per kg percentiles
+@emission_model(
+    "direct_inorganic",
+    values=("fertiliser_input", "crop_yield"),
+    fert_types=dfe.INORGANIC_FERT_TYPES,
+    uncertainty=True,
+)
+def direct_inorganic(inputs: dict) -> pd.DataFrame:
+    """Direct N2O emissions of mineral fertiliser, IPCC 2019 Tier 1."""
+    fertiliser = inputs["fertiliser_input"]
+    df_emissions = inputs["emission_factor"].assign(fertiliser_input=fertiliser)
+    df_emissions["N2O emission"] = dfe.n2o_emission(fertiliser, df_emissions["emission_factor"])
+    df_emissions["N2O emission per ha"] = df_emissions["N2O emission"] * dfe.M2_PER_HA
+    return df_emissions
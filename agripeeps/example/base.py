@@ -1,6 +1,7 @@
 import itertools
 from abc import ABC, abstractmethod
 from datetime import date
+from typing import Iterable, Iterator, Optional, Union
 
 import pandas as pd
 
@@ -10,6 +11,10 @@ from sentier_data_tools.local_storage.fields import DatasetKind
 from sentier_data_tools.logs import stdout_feedback_logger as logger
 from sentier_data_tools.model.arguments import Demand, Flow, RunConfig
 
+import connections
+import instrumentation
+from iri_hierarchy import HierarchyIndex, expand_terms, hierarchy_index
+
 
 class SentierModel(ABC):
     def __init__(self, demand: Demand, run_config: RunConfig):
@@ -73,21 +78,14 @@ class SentierModel(ABC):
     def _provides_str(self):
         return {str(elem) for elem in self.provides}
 
+    # The expansions are cached per set of terms, see `iri_hierarchy.expand_terms`
     @property
     def _provides_narrower(self):
-        return {
-            str(other)
-            for elem in self.provides
-            for other in elem.narrower(raw_strings=True)
-        }
+        return expand_terms(tuple(self.provides), "narrower")
 
     @property
     def _provides_broader(self):
-        return {
-            str(other)
-            for elem in self.provides
-            for other in elem.broader(raw_strings=True)
-        }
+        return expand_terms(tuple(self.provides), "broader")
 
     @property
     def _needs_str(self):
@@ -95,51 +93,108 @@ class SentierModel(ABC):
 
     @property
     def _needs_narrower(self):
-        return {
-            str(other)
-            for elem in self.needs
-            for other in elem.narrower(raw_strings=True)
-        }
+        return expand_terms(tuple(self.needs), "narrower")
 
     @property
     def _needs_broader(self):
-        return {
-            str(other)
-            for elem in self.needs
-            for other in elem.broader(raw_strings=True)
-        }
+        return expand_terms(tuple(self.needs), "broader")
 
     def get_model_data(
         self, product: VocabIRI, kind: DatasetKind, relabel_columns: bool = True
     ) -> dict:
-        return {
-            "exactMatch": list(
-                Dataset.select().where(
-                    Dataset.kind == kind,
-                    Dataset.product == str(product),
-                )
-            ),
-            "broader": list(
-                Dataset.select().where(
-                    Dataset.kind == kind,
-                    Dataset.product << product.broader(raw_strings=True),
-                )
-            ),
-            "narrower": list(
-                Dataset.select().where(
-                    Dataset.kind == kind,
-                    Dataset.product << product.narrower(raw_strings=True),
-                )
-            ),
-        }
-
-    def merge_datasets_to_dataframes(self, lst: list[Dataset]) -> pd.DataFrame:
-        if not lst:
-            return pd.DataFrame()
-        elif len(lst) == 1:
-            return lst[0].dataframe
-        else:
-            given = lst.pop(0)
-            while lst:
-                given = pd.merge(given, lst.pop(0), how="outer")
-            return given
\ No newline at end of file
+        return get_model_data(product, kind)
+
+    def merge_datasets_to_dataframes(
+        self, lst: list[Dataset], keep_metadata: bool = True, lazy: bool = False
+    ) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+        return merge_datasets(lst, keep_metadata=keep_metadata, lazy=lazy)
+
+
+def get_model_data(
+    product: VocabIRI, kind: DatasetKind, index: Optional[HierarchyIndex] = None, snapshot=None
+) -> dict:
+    """Datasets of `kind` for `product` and its broader and narrower terms.
+
+    The related IRIs come from the precomputed `HierarchyIndex` and all datasets
+    are fetched with a single `IN` query, then grouped by match relation. With
+    a `snapshot.Snapshot` its datasets are used instead of the datastore."""
+    relation = (index or hierarchy_index()).relations(product)
+    results = {"exactMatch": [], "broader": [], "narrower": []}
+    if snapshot is not None:
+        datasets = snapshot.datasets(kind, relation)
+    else:
+        datasets = connections.bind(
+            Dataset.select().where(Dataset.kind == kind, Dataset.product << list(relation))
+        )
+        instrumentation.count("db_queries")
+    for dataset in datasets:
+        results[relation[str(dataset.product)]].append(dataset)
+    instrumentation.count("datasets_loaded", sum(map(len, results.values())))
+    return results
+
+
+METADATA_COLUMNS = ("location", "valid_from")
+
+
+def dataset_frames(
+    lst: Iterable[Dataset], keep_metadata: bool = True
+) -> Iterator[pd.DataFrame]:
+    for dataset in lst:
+        df = dataset.dataframe
+        if keep_metadata:
+            df = df.assign(
+                location=str(dataset.location), valid_from=dataset.valid_from
+            )
+        yield df
+
+
+def merge_datasets(
+    lst: Iterable[Dataset], keep_metadata: bool = True, lazy: bool = False
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Combine the dataframes of `lst` into one, without modifying `lst`.
+
+    The result is the outer join of the dataframes on the columns they all
+    share, as chained `pd.merge(how="outer")` calls would give, computed in a
+    single concat/groupby pass when every dataframe has at most one row per
+    key. With `keep_metadata`, each row carries the `location` and `valid_from`
+    of its dataset; these only join rows that also share a data column, and
+    dataframes without one are stacked. With `lazy`, an iterator over the
+    per-dataset dataframes is returned instead."""
+    if lazy:
+        return dataset_frames(lst, keep_metadata)
+    frames = list(dataset_frames(lst, keep_metadata))
+    instrumentation.count("rows_merged", sum(len(df) for df in frames))
+    if not frames:
+        return pd.DataFrame()
+    elif len(frames) == 1:
+        return frames[0]
+
+    shared = [
+        column
+        for column in frames[0].columns
+        if all(column in df.columns for df in frames[1:])
+    ]
+    if not set(shared) - set(METADATA_COLUMNS):
+        return pd.concat(frames, ignore_index=True, sort=False)
+    if not single_pass_mergeable(frames, shared):
+        merged = frames[0]
+        for df in frames[1:]:
+            merged = pd.merge(merged, df, how="outer")
+        return merged
+    combined = pd.concat(frames, ignore_index=True, sort=False)
+    if len(shared) == len(combined.columns):
+        return combined.drop_duplicates().sort_values(shared, ignore_index=True)
+    # each group holds at most one row per dataframe and each other column comes from one of them
+    merged = combined.groupby(shared, dropna=False, as_index=False).first()
+    return merged[list(combined.columns)]
+
+
+def single_pass_mergeable(frames: list[pd.DataFrame], keys: list[str]) -> bool:
+    """Whether the groupby in `merge_datasets` gives the outer join of `frames`.
+
+    Needs unique `keys` in each dataframe and no other column in several of
+    them, otherwise rows multiply or join on more columns."""
+    others = [column for df in frames for column in df.columns if column not in keys]
+    if len(others) != len(set(others)):
+        return False
+    return not any(df.duplicated(keys).any() for df in frames)
@@ -1,31 +1,72 @@
 #find match
-from sentier_data_tools.iri import ProductIRI
+from functools import lru_cache
+from typing import Optional
 import pandas as pd
 from datetime import date
 import logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
-
-def find_match_IRI(product_IRI: ProductIRI, unique_IRI_list : list, allow_broader:bool = True):
-    if product_IRI in unique_IRI_list :
-        print('yaas')
-        closest_match_IRI = product_IRI
-        logging.log(logging.INFO, f"Exact match found for {product_IRI.display()}")
-    else :
-        if allow_broader :
-            for broader_IRI in product_IRI.broader():
-                if broader_IRI in unique_IRI_list:
-                    closest_match_IRI = broader_IRI
-                    logging.log(logging.INFO, f"Found broader match for {broader_IRI.display()}")
-                    break                   
-        else: 
-            logging.ERROR('Exact match not found, please set allow_broader to True to find closest match')
-    return closest_match_IRI
+from iri_hierarchy import HierarchyIndex, hierarchy_index
 
-def format_df(df : pd.DataFrame(), productIRI_columns_list):
-    df[productIRI_columns_list] = df[productIRI_columns_list].map(lambda x : ProductIRI(x))
-    return df
+class IRIMatcher:
+    """Closest IRI among a fixed set of candidates: the IRI itself or its nearest broader term.
+
+    Candidates are held in a hash map and ancestor chains come from the shared
+    `HierarchyIndex`, so each query costs a few dict lookups; results are kept in
+    an LRU cache. `None` means no match.
+    """
+
+    def __init__(self, candidates, allow_broader: bool = True, index: Optional[HierarchyIndex] = None, maxsize: int = 4096):
+        self.candidates = {str(iri): iri for iri in candidates}
+        self.allow_broader = allow_broader
+        self.index = index
+        self.match = lru_cache(maxsize=maxsize)(self._match)
+
+    def __call__(self, product_IRI):
+        return self.match(str(product_IRI))
+
+    def _match(self, iri: str):
+        if iri in self.candidates:
+            logging.debug("Exact match found for %s", iri)
+            return self.candidates[iri]
+        if self.allow_broader:
+            for broader_IRI in (self.index or hierarchy_index()).broader(iri):
+                if broader_IRI in self.candidates:
+                    logging.debug("Found broader match %s for %s", broader_IRI, iri)
+                    return self.candidates[broader_IRI]
+        logging.warning("No match found for %s", iri)
+        return None
+
+    def match_many(self, product_IRIs):
+        """Resolve a list or Series of IRIs, each distinct IRI once."""
+        if isinstance(product_IRIs, pd.Series):
+            unique = product_IRIs.dropna().unique()
+            return product_IRIs.map({iri: self(iri) for iri in unique})
+        return [self(iri) for iri in product_IRIs]
 
 
+@lru_cache(maxsize=128)
+def iri_matcher(candidates: frozenset, allow_broader: bool = True) -> IRIMatcher:
+    return IRIMatcher(candidates, allow_broader=allow_broader)
 
 
-    
\ No newline at end of file
+def find_match_IRI(product_IRI: "ProductIRI", unique_IRI_list : list, allow_broader:bool = True):
+    if not allow_broader and str(product_IRI) not in map(str, unique_IRI_list):
+        logging.error('Exact match not found, please set allow_broader to True to find closest match')
+    return iri_matcher(frozenset(unique_IRI_list), allow_broader)(product_IRI)
+
+@lru_cache(maxsize=65536)
+def intern_iri(iri: str) -> "ProductIRI":
+    from sentier_data_tools.iri import ProductIRI
+
+    return ProductIRI(iri)
+
+
+def format_df(df : pd.DataFrame(), productIRI_columns_list):
+    """Turn the IRI columns into categoricals of interned `ProductIRI`.
+
+    Each distinct IRI is converted once, and comparisons against a `ProductIRI`
+    run on the integer category codes."""
+    for column in productIRI_columns_list:
+        codes, uniques = pd.factorize(df[column])
+        categories = pd.Index([intern_iri(str(iri)) for iri in uniques], dtype=object)
+        df[column] = pd.Categorical.from_codes(codes, categories=categories)
+    return df
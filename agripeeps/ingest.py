@@ -0,0 +1,82 @@
+#Bulk population of the local datastore
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import pandas as pd
+from loguru import logger
+
+# datasets per INSERT statement
+BATCH_SIZE = 200
+# serialization processes, `None` for one per CPU; 0 or 1 serializes in the calling process.
+# A spawned worker re-imports pandas, pyarrow and sentier_data_tools (about 1s) while a frame
+# serializes in about 1ms, so the pool only pays off for very large loads and is opt-in
+WORKERS = 1
+
+# builds run beside reader threads (see `connections`), forking a threaded process can deadlock
+START_METHOD = "spawn"
+
+RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def serialize_frame(df: pd.DataFrame) -> bytes:
+    """Arrow IPC bytes exactly as `Dataset.dataframe` stores them."""
+    from sentier_data_tools.local_storage.fields import PandasFeatherField
+
+    return PandasFeatherField().db_value(df)
+
+
+def serialize_frames(frames: list[pd.DataFrame], workers: Optional[int] = WORKERS) -> list[bytes]:
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(frames) <= 1:
+        return [serialize_frame(df) for df in frames]
+    chunksize = max(1, len(frames) // (workers * 4))
+    context = multiprocessing.get_context(START_METHOD)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        return list(executor.map(serialize_frame, frames, chunksize=chunksize))
+
+
+def bulk_insert(
+    records: list[dict], batch_size: int = BATCH_SIZE, workers: Optional[int] = WORKERS
+) -> list[int]:
+    """Insert `sdt.Dataset` field dicts and return their ids, in order.
+
+    Dataframes are serialized up front (in parallel with `workers` above 1), then the
+    rows go in `batch_size` at a time through the connection of the database
+    `Dataset` is bound to, inside one transaction."""
+    if not records:
+        return []
+    from peewee import Value
+    from sentier_data_tools.local_storage.db import Dataset
+
+    start = time.perf_counter()
+    blobs = serialize_frames([record["dataframe"] for record in records], workers)
+    serialized = time.perf_counter()
+
+    ids = []
+    with Dataset._meta.database.atomic():
+        for offset in range(0, len(records), batch_size):
+            rows = [
+                dict(record, dataframe=Value(blob, unpack=False))
+                for record, blob in zip(
+                    records[offset : offset + batch_size], blobs[offset : offset + batch_size]
+                )
+            ]
+            if RETURNING:
+                ids.extend(row.id for row in Dataset.insert_many(rows).returning(Dataset.id).execute())
+            else:
+                ids.extend(Dataset.insert(**row).execute() for row in rows)
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Inserted {} datasets in {:.2f}s ({:.0f} datasets/sec, {:.2f}s serializing)",
+        len(records),
+        elapsed,
+        len(records) / elapsed if elapsed else float("inf"),
+        serialized - start,
+    )
+    return ids
@@ -0,0 +1,68 @@
+#Fertiliser and yield values by (product, location, year)
+import bisect
+from functools import lru_cache
+from typing import Optional
+
+import pandas as pd
+
+import batch
+import instrumentation
+from snapshot import open_snapshot
+
+# long tables of `batch.load_tables` held in the index
+INPUTS = ("fertiliser_input", "crop_yield")
+
+
+class InputIndex:
+    """Fertiliser and crop yield values of every product, location and year.
+
+    Exact lookups are a single dict access. For a missing year the closest
+    stored year of the same product and location is used, the earlier one on a
+    tie."""
+
+    def __init__(self, tables: dict[str, pd.DataFrame]):
+        self.values = {}
+        self.years = {}
+        for name in INPUTS:
+            df = tables[name]
+            years = pd.to_numeric(df["year"], errors="coerce")
+            df = df.assign(year=years).dropna(subset=["year"]).astype({"year": int})
+            self.values[name] = dict(
+                zip(zip(df["product"], df["location"], df["year"]), df[name].astype(float))
+            )
+            self.years[name] = {
+                key: sorted(group.tolist())
+                for key, group in df.groupby(["product", "location"], sort=False)["year"]
+            }
+
+    @classmethod
+    def from_datastore(cls, snapshot=None) -> "InputIndex":
+        return cls(batch.load_tables(snapshot))
+
+    def lookup(self, name: str, product, location, year, nearest: bool = True) -> Optional[tuple[float, int]]:
+        """`(value, year)` of input `name`, or `None` if the product has no data at `location`.
+
+        Without a `year` the latest stored one is used."""
+        product, location = str(product), str(location)
+        if year is None:
+            years = self.years[name].get((product, location))
+            return (self.values[name][(product, location, years[-1])], years[-1]) if years else None
+        year = int(year)
+        value = self.values[name].get((product, location, year))
+        if value is not None:
+            instrumentation.count("input_index_hits")
+            return value, year
+        years = self.years[name].get((product, location))
+        if not nearest or not years:
+            instrumentation.count("input_index_misses")
+            return None
+        instrumentation.count("input_index_nearest")
+        position = bisect.bisect_left(years, year)
+        closest = min(years[max(position - 1, 0) : position + 1], key=lambda stored: (abs(stored - year), stored))
+        return self.values[name][(product, location, closest)], closest
+
+
+@lru_cache(maxsize=1)
+def input_index(build_id: Optional[str], snapshot: Optional[str] = None) -> InputIndex:
+    """Index of the local datastore or of the snapshot at `snapshot`, rebuilt when `build_id` changes."""
+    return InputIndex.from_datastore(None if snapshot is None else open_snapshot(snapshot))
@@ -0,0 +1,144 @@
+#Stage timings, counters and optional tracing spans
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# (metrics, stage name) of the stage running in the current thread or task
+_current: ContextVar[Optional[tuple]] = ContextVar("agripeeps_stage", default=None)
+
+
+class Metrics:
+    """Wall time, call count and counters per stage.
+
+    Counters are incremented with `count` from anywhere below a stage and are
+    attributed to the innermost running stage. Updates are locked, stages of
+    one run record from executor threads concurrently."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = Counter()
+        self.counters = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def add(self, stage: str, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[stage][counter] += n
+
+    def stage_counters(self, stage: str) -> Counter:
+        with self._lock:
+            return Counter(self.counters[stage])
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                stage: {"calls": self.calls[stage], "seconds": self.seconds[stage], **self.counters[stage]}
+                for stage in self.calls
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.seconds.clear()
+            self.calls.clear()
+            self.counters.clear()
+
+
+class NoopSpan:
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NoopTracer:
+    """Default tracer, spans cost one object allocation."""
+
+    def start_as_current_span(self, name: str, attributes: Optional[dict] = None) -> NoopSpan:
+        return NoopSpan()
+
+
+tracer = NoopTracer()
+
+
+def set_tracer(new_tracer) -> None:
+    """Send stage spans to `new_tracer`, anything with OpenTelemetry's `start_as_current_span`."""
+    global tracer
+    tracer = new_tracer
+
+
+def use_opentelemetry(name: str = "agripeeps") -> None:
+    from opentelemetry import trace
+
+    set_tracer(trace.get_tracer(name))
+
+
+def count(counter: str, n: int = 1) -> None:
+    """Add `n` to `counter` of the running stage, no-op outside of a stage."""
+    current = _current.get()
+    if current is not None:
+        metrics, stage_name = current
+        metrics.add(stage_name, counter, n)
+
+
+@contextmanager
+def stage(metrics: Metrics, name: str):
+    token = _current.set((metrics, name))
+    with tracer.start_as_current_span(f"agripeeps.{name}") as span:
+        traced = not isinstance(span, NoopSpan)
+        before = metrics.stage_counters(name) if traced else None
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            metrics.record(name, time.perf_counter() - start)
+            _current.reset(token)
+            if traced:
+                for counter, value in (metrics.stage_counters(name) - before).items():
+                    span.set_attribute(f"agripeeps.{counter}", value)
+
+
+def timed(name: str):
+    """Run a method as stage `name` of `self.metrics`, coroutine methods included."""
+
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                with stage(self.metrics, name):
+                    return await method(self, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with stage(self.metrics, name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def in_executor(executor, function, *args):
+    """Await `function(*args)` run on `executor` (the loop default if `None`).
+
+    The call runs in a copy of the current context, so its counters go to the
+    stage that awaits it."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, context.run, function, *args)
@@ -0,0 +1,179 @@
+#Precomputed broader/narrower relations between vocabulary IRIs
+import atexit
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from functools import lru_cache
+from importlib.metadata import version
+from pathlib import Path
+from typing import Optional, Union
+
+from loguru import logger
+
+import instrumentation
+from paths import DATASTORE_DIR
+
+VOCAB_PATH = Path(__file__).parent / "agriculture-voc.ttl"
+# IRI expansions persisted across restarts, set to `None` to keep them in memory only
+CACHE_PATH = DATASTORE_DIR / "agripeeps-iri-hierarchy.json"
+# new expansions written to `CACHE_PATH` together, and at exit
+SAVE_EVERY = 32
+
+
+def vocab_version(path: Path = VOCAB_PATH) -> str:
+    """Changes with the local vocabulary file or the sentier vocabulary client."""
+    digest = hashlib.sha256(Path(path).read_bytes())
+    digest.update(version("sentier_data_tools").encode())
+    return digest.hexdigest()[:16]
+
+
+def breadth_first(start: str, edges: dict) -> list[str]:
+    ordered, queue = [], deque([start])
+    while queue:
+        for other in edges.get(queue.popleft(), ()):
+            if other != start and other not in ordered:
+                ordered.append(other)
+                queue.append(other)
+    return ordered
+
+
+class HierarchyIndex:
+    """Ancestors and descendants of vocabulary IRIs, computed once per IRI.
+
+    Relations come from the local `agriculture-voc.ttl` and from the sentier
+    vocabulary (`VocabIRI.broader`/`narrower`). Plain strings are looked up as
+    `ProductIRI`.
+
+    New expansions are written to `cache_path` every `SAVE_EVERY` misses and
+    on `flush` (also at exit), merged with what other processes saved meanwhile.
+    """
+
+    def __init__(
+        self,
+        parents: dict = None,
+        cache_path: Optional[Path] = None,
+        version: Optional[str] = None,
+    ):
+        self.parents = defaultdict(set, parents or {})
+        self.children = defaultdict(set)
+        for child, elems in self.parents.items():
+            for parent in elems:
+                self.children[parent].add(child)
+        self.cache_path = cache_path
+        self.version = version
+        self._cache = self._load_cache()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        if cache_path is not None:
+            atexit.register(self.flush)
+
+    @classmethod
+    def from_turtle(
+        cls, path: Path = VOCAB_PATH, cache_path: Optional[Path] = None
+    ) -> "HierarchyIndex":
+        from rdflib import Graph
+        from rdflib.namespace import SKOS
+
+        graph = Graph()
+        graph.parse(path, format="turtle")
+        parents = defaultdict(set)
+        for child, parent in graph.subject_objects(SKOS.broader):
+            parents[str(child)].add(str(parent))
+        for parent, child in graph.subject_objects(SKOS.narrower):
+            parents[str(child)].add(str(parent))
+        return cls(parents, cache_path=cache_path, version=vocab_version(path))
+
+    def _load_cache(self) -> dict:
+        if self.cache_path is None or not Path(self.cache_path).exists():
+            return {}
+        try:
+            content = json.loads(Path(self.cache_path).read_text())
+        except ValueError:
+            return {}
+        if content.get("version") != self.version:
+            logger.info("Vocabulary changed, discarding cached IRI expansions")
+            return {}
+        return {
+            (iri, direction): tuple(found)
+            for direction, expansions in content["expansions"].items()
+            for iri, found in expansions.items()
+        }
+
+    def _save_cache(self, cache: dict) -> None:
+        # entries saved by other processes are kept, ours win on conflicts
+        cache = {**self._load_cache(), **cache}
+        expansions = defaultdict(dict)
+        for (iri, direction), found in cache.items():
+            expansions[direction][iri] = list(found)
+        path = Path(self.cache_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"version": self.version, "expansions": expansions}))
+        tmp.replace(path)
+
+    def flush(self) -> None:
+        """Write the expansions not saved yet to `cache_path`."""
+        with self._lock:
+            if self.cache_path is None or not self._unsaved:
+                return
+            cache, self._unsaved = dict(self._cache), 0
+        self._save_cache(cache)
+
+    def broader(self, iri: Union["VocabIRI", str]) -> tuple[str, ...]:
+        return self._lookup(iri, "broader")
+
+    def narrower(self, iri: Union["VocabIRI", str]) -> tuple[str, ...]:
+        return self._lookup(iri, "narrower")
+
+    def relations(self, iri: Union["VocabIRI", str]) -> dict[str, str]:
+        """Map of every related IRI to `exactMatch`, `broader` or `narrower`."""
+        relation = {other: "narrower" for other in self.narrower(iri)}
+        relation.update({other: "broader" for other in self.broader(iri)})
+        relation[str(iri)] = "exactMatch"
+        return relation
+
+    def _lookup(self, iri: Union["VocabIRI", str], direction: str) -> tuple[str, ...]:
+        key = (str(iri), direction)
+        try:
+            found = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            instrumentation.count("iri_cache_hits")
+            return found
+        instrumentation.count("iri_cache_misses")
+        found = self._expand(iri, direction)
+        with self._lock:
+            self._cache[key] = found
+            self._unsaved += 1
+            save = self._unsaved >= SAVE_EVERY
+        if save:
+            self.flush()
+        return found
+
+    def _expand(self, iri: Union["VocabIRI", str], direction: str) -> tuple[str, ...]:
+        from sentier_data_tools.iri import ProductIRI, VocabIRI
+
+        edges = self.parents if direction == "broader" else self.children
+        found = breadth_first(str(iri), edges)
+        if not isinstance(iri, VocabIRI):
+            iri = ProductIRI(iri)
+        for other in getattr(iri, direction)(raw_strings=True):
+            if other not in found:
+                found.append(other)
+        return tuple(found)
+
+
+@lru_cache(maxsize=1)
+def hierarchy_index() -> HierarchyIndex:
+    """Process-wide index built from the local vocabulary file."""
+    return HierarchyIndex.from_turtle(cache_path=CACHE_PATH)
+
+
+@lru_cache(maxsize=None)
+def expand_terms(terms: tuple, direction: str) -> frozenset[str]:
+    """All `broader` or `narrower` IRIs of `terms`, computed once per set of terms."""
+    index = hierarchy_index()
+    return frozenset(other for elem in terms for other in getattr(index, direction)(elem))
@@ -0,0 +1,20 @@
+#Deferred imports of heavy dependencies
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Module `name`, executed on first attribute access instead of now.
+
+    Used for `sentier_data_tools`, which takes a large share of the import time
+    of every agripeeps module but is not needed for cached lookups."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
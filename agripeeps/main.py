@@ -7,18 +7,24 @@ from datetime import date
 import create_data
 import logging
 import itertools
-logging.basicConfig(
-    filename="app.log",
-    level=logging.DEBUG, 
-    encoding="utf-8",
-    filemode="a",
-    format="{asctime} - {levelname} - {message}",
-    style="{",
-    datefmt="%Y-%m-%d %H:%M",
-)
-
+import asyncio
 import warnings
-warnings.filterwarnings("ignore")
+from concurrent.futures import Executor
+
+
+def configure_logging(filename: str = "app.log", level: int = logging.DEBUG, ignore_warnings: bool = True) -> None:
+    # left to scripts and notebooks, importing agripeeps does not touch the logging or warnings setup
+    if ignore_warnings:
+        warnings.filterwarnings("ignore")
+    logging.basicConfig(
+        filename=filename,
+        level=level, 
+        encoding="utf-8",
+        filemode="a",
+        format="{asctime} - {levelname} - {message}",
+        style="{",
+        datefmt="%Y-%m-%d %H:%M",
+    )
 
 from sentier_data_tools import (
     DatasetKind,
@@ -32,6 +38,17 @@ from sentier_data_tools import (
     SentierModel,
 )
 import DirectFertiliserEmission as dfe
+from example.base import get_model_data, merge_datasets
+import uncertainty
+import instrumentation
+import emission_models
+import connections
+import result_cache
+from contextlib import nullcontext
+from instrumentation import Metrics, in_executor, timed
+from snapshot import import_snapshot, open_snapshot
+from manifest import BuildManifest
+from input_index import input_index
 
 ## Attention : I would like demand to come from user input, I need mapping from natural language to IRI for product and geonames
 
@@ -52,6 +69,18 @@ class UserInput(BaseModel):
 
 class RunConfig(BaseModel):
     num_samples: int = 1000
+    seed: Optional[int] = None
+    # datastore snapshot (see `snapshot.export_snapshot`) read in place of the local datastore, which is then not built
+    snapshot: Optional[str] = None
+    # names of the `emission_models.EMISSION_MODELS` evaluated together
+    emission_models: list[str] = ["direct_inorganic"]
+    # query the existing datastore through the read-only pool of `connections` and never write to it
+    read_only: bool = False
+    # reuse the results of identical demands on the same datastore build, see `result_cache`
+    cache_results: bool = False
+
+# `Crop` and `UserInput` attribute of each `emission_models.VALUES` input
+INPUT_ATTRIBUTES = {"fertiliser_input": "fertilizer_amount", "crop_yield": "crop_yield_val"}
 
 class Crop(SentierModel):
     def __init__(self, user_input: UserInput, run_config: RunConfig):
@@ -75,91 +104,235 @@ class Crop(SentierModel):
             ) : 'emission_factor'}
         # Assuming user_input maps to demand in SentierModel
         super().__init__(demand=user_input, run_config=run_config)
+        # stage timings and counters, see `instrumentation`
+        self.metrics = Metrics()
 
-    def run_create_data(self) :
-        create_data.reset_db()
-        create_data.create_yield_local_datastorage()
-        create_data.create_fertiliser_local_datastorage()
-        create_data.create_emissionfactors_local_datastorage()
+    @timed("run_create_data")
+    def run_create_data(self, refresh: bool = False, rebuild: bool = False, snapshot: Optional[str] = None) :
+        # reuses the existing store unless the sources changed, see `create_data.build_local_datastorage`
+        self.build_id = None
+        if snapshot is not None:
+            self.datastore = import_snapshot(snapshot)
+            return
+        self.datastore = create_data.build_local_datastorage(refresh=refresh, rebuild=rebuild)
 
     def select_right_value_from_df(self, df, strategy = "first"):
         if strategy == "first":
             return df.values[0]
-    
-    def get_all_input(self) :
-        # get all BOM tables and PARAMETERS
-        agridata_bom = self.get_model_data(
-                product=self.demand.product_iri, kind=DatasetKind.BOM
-                )
-        agridata_bom_exact = self.merge_datasets_to_dataframes(agridata_bom['exactMatch'])
-        agridata_param = self.get_model_data(
-                product=self.demand.product_iri, kind=DatasetKind.PARAMETERS
-            )
-        agridata_param_exact = self.merge_datasets_to_dataframes(agridata_param['exactMatch'])
-        agridata_param_broader = self.merge_datasets_to_dataframes(agridata_param['broader'])
+
+    @property
+    def snapshot(self):
+        # opened once per process, its partitions are read when first needed
+        return open_snapshot(self.run_config.snapshot) if self.run_config.snapshot else None
+
+    def builds_datastore(self) -> bool:
+        return not self.run_config.read_only and self.run_config.snapshot is None
+
+    def get_model_data(self, product, kind):
+        # one query for exact, broader and narrower matches, see `example.base.get_model_data`
+        results = get_model_data(product, kind, snapshot=self.snapshot)
+        for dataset in itertools.chain(*results.values()):
+            dataset.dataframe.apply_aliases(self.aliases)
+        return results
+
+    def merge_datasets_to_dataframes(self, lst, keep_metadata: bool = True, lazy: bool = False):
+        return merge_datasets(lst, keep_metadata=keep_metadata, lazy=lazy)
+
+    def input_value(self, name):
+        # `input_index` holds every BOM and PARAMETERS value, the nearest year is used if the demanded one is missing
+        found = input_index(self.datastore_build_id(), self.run_config.snapshot).lookup(
+            name, self.demand.product_iri, self.demand.spatial_context, self.demand.year
+        )
+        if found is None:
+            logging.error("No %s for %s in %s", name, self.demand.product_iri, self.demand.spatial_context)
+            return None
+        value, year = found
+        if str(year) != str(self.demand.year):
+            logging.warning("year not available : %s in %s, using %s", self.demand.year, self.demand.spatial_context, year)
+        return value
+
+    def set_climate(self):
         #Define climate
         logging.info("Getting climate")
         if self.demand.climate_type is None:
             self.climate_key = 'default'
         else:
             if self.demand.climate_type not in ['wet', 'dry']:
-                logging.error(f"Invalid climate type value: {self.demand.climate_type}. Expected 'wet', 'dry', or None.")
+                logging.error("Invalid climate type value: %s. Expected 'wet', 'dry', or None.", self.demand.climate_type)
             self.climate_key = self.demand.climate_type
             
-        #Define fertilizer amount
-        if self.demand.fertilizer_amount is None :            
-            if self.mineral_fertilizer in [ProductIRI(col) for col in agridata_bom_exact.columns] and agridata_bom_exact.location == self.demand.spatial_context:
-                if self.demand.year in list(agridata_bom_exact.dataframe.year):
-                    self.fertilizer_amount = self.select_right_value_from_df(agridata_bom_exact.dataframe[agridata_bom_exact.dataframe.year == self.demand.year])
-                else:
-                    logging.error(f"year not available : {agridata_bom_exact}")
-        else : 
-            self.fertilizer_amount = self.demand.fertilizer_amount
-        
-        logging.info(f"fertilizer amount: {self.fertilizer_amount}")
-        
-        #Define yield
-        if self.demand.crop_yield_val is None :
-            if self.crop_yield in [ProductIRI(col) for col in agridata_param_exact.columns] and agridata_param_exact.location == self.demand.spatial_context:
-                if self.demand.year in list(agridata_param_exact.dataframe.year):
-                    self.crop_yield_val = self.select_right_value_from_df(agridata_param_exact.dataframe[i.dataframe.year == self.demand.year])
-                    logging.info(f"Set input data: {self.crop_yield}")
-                else:
-                    logging.error(f"year not available : {agridata_param_exact}")
-        else :
-            self.crop_yield_val = self.demand.crop_yield_val
-
-        logging.info(f"crop yield: {self.crop_yield_val}")
-
-        #Getting emission factor
-        if self.emission_factor in [ProductIRI(col) for col in agridata_param_exact.columns]:
-            if self.climate_key in agridata_param_exact.columns:
-                self.emission_factor_val = agridata_param_exact.database.query(f"climate_type == {self.climate_key} and fert_type in ['default','inorganic']")
-                logging.info(f"Emission factor: {self.emission_factor_val}")
-        else : 
-            print("couldn't find exact match")
-            #if self.climate_key in agridata_param_broader.columns:
-            climate_key_vals = ['default','inorganic']
-            self.emission_factor_val = agridata_param_broader.query(f"climate_type == @self.climate_key and fert_type.isin(@climate_key_vals)")
-            
-            logging.info(f"Emission factor: {self.emission_factor_val} for broader concept")
+        self.models = emission_models.get_models(self.run_config.emission_models)
+
+    def get_input_values(self):
+        #Define fertilizer amount, yield and any other input of the selected models, each once
+        for name in emission_models.needed_values(self.models):
+            attribute = INPUT_ATTRIBUTES[name]
+            value = getattr(self.demand, attribute)
+            if value is None:
+                value = self.input_value(name)
+            setattr(self, attribute, value)
+            logging.info("%s: %s", name, value)
+
+    def get_emission_factors(self):
+        #Getting emission factors, exact match first then broader concepts
+        # the PARAMETERS query and merges are shared by all fertiliser type sets
+        parameters = {}
+        merged = {}
+
+        def candidates():
+            for relation in ("exactMatch", "broader"):
+                if relation not in merged:
+                    if not parameters:
+                        parameters.update(self.get_model_data(
+                            product=self.demand.product_iri, kind=DatasetKind.PARAMETERS
+                        ))
+                    merged[relation] = self.merge_datasets_to_dataframes(parameters[relation])
+                yield merged[relation]
+                logging.debug("couldn't find %s", relation)
+
+        self.emission_factors = {
+            frozenset(fert_types): dfe.emission_factor_resolver().resolve(
+                self.demand.product_iri,
+                self.climate_key,
+                fert_types,
+                build_id=self.datastore_build_id(),
+                candidates=candidates,
+            )
+            for fert_types in emission_models.needed_fert_types(self.models)
+        }
+        self.emission_factor_val = self.emission_factors.get(frozenset(dfe.INORGANIC_FERT_TYPES))
+        logging.debug("Emission factors: %s", self.emission_factors)
+
+    @timed("get_all_input")
+    def get_all_input(self) :
+        self.set_climate()
+        self.get_input_values()
+        self.get_emission_factors()
+
+    @timed("get_all_input")
+    async def aget_all_input(self, executor: Optional[Executor] = None):
+        # input values (from `input_index`) and emission factors come from independent queries
+        self.set_climate()
+        await asyncio.gather(
+            in_executor(executor, self.reading_from, self.get_input_values),
+            in_executor(executor, self.reading_from, self.get_emission_factors),
+        )
+
+    def reading(self):
+        # with `read_only` the queries go through the read-only pool, see `connections.reading`
+        if self.run_config.read_only and self.run_config.snapshot is None:
+            return connections.reading()
+        return nullcontext()
+
+    def reading_from(self, method):
+        with self.reading():
+            return method()
+
+    def datastore_build_id(self):
+        # emission factors resolved for another build are not reused, see `dfe.EmissionFactorResolver`
+        # loaded once per run, the manifest is parsed and hashed in full
+        if getattr(self, "build_id", None) is None:
+            datastore = self.snapshot or getattr(self, "datastore", None) or BuildManifest.load()
+            self.build_id = datastore.build_id
+        return self.build_id
         
-                                
         
+    @timed("get_emissions")
     def get_emissions(self):
         #self.emission_per_ha = dfe.run(self.demand.product_iri, self.fertilizer_amount, self.emission_factor_val, self.climate_key)
 
-        df_emissions = self.emission_factor_val
-        df_emissions["fertiliser_input"] = self.fertilizer_amount
-        df_emissions["N2O emission"] = (28+16)/28 * df_emissions["fertiliser_input"] * df_emissions['emission_factor']
-        # this should be handled by unit conversion at some point
-        df_emissions["N2O emission per ha"] = df_emissions["N2O emission"] * 10000
+        frames = []
+        for model in self.models:
+            inputs = {name: getattr(self, INPUT_ATTRIBUTES[name]) for name in model.values}
+            if model.fert_types is not None:
+                inputs["emission_factor"] = self.emission_factors[frozenset(model.fert_types)]
+            frames.append(model.compute(inputs).assign(model=model.name))
+        df_emissions = pd.concat(frames, ignore_index=True)
         self.emission_per_ha = df_emissions
+        sampled = df_emissions[df_emissions["model"].isin([model.name for model in self.models if model.uncertainty])]
+        if self.run_config.num_samples > 0 and len(sampled):
+            # one row of percentiles per model
+            self.emission_percentiles = uncertainty.emission_percentiles(
+                sampled.assign(demand=sampled["model"], crop_yield=getattr(self, "crop_yield_val", None)),
+                num_samples=self.run_config.num_samples,
+                rng=self.run_config.seed,
+            )
+        instrumentation.count("emission_rows", len(df_emissions))
         logging.info("Getting emission from fertilizer")
         
+    def load_cached_result(self) -> bool:
+        """Take `emission_per_ha` and `emission_percentiles` from the result cache, if there.
+
+        Intermediate values such as `fertilizer_amount` are not set on a hit."""
+        if not self.run_config.cache_results:
+            return False
+        self.result_key = result_cache.result_key(self.demand, self.run_config, self.datastore_build_id())
+        found = result_cache.result_cache().get(self.result_key)
+        if found is None or "emission_per_ha" not in found:
+            return False
+        for name, df in found.items():
+            setattr(self, name, df)
+        return True
+
+    def store_result(self):
+        if self.run_config.cache_results:
+            result_cache.result_cache().put(
+                self.result_key, {name: getattr(self, name, None) for name in result_cache.FRAMES}
+            )
+
+    @timed("run")
     def run(self):
-        self.run_create_data()
-        self.get_all_input()
+        self.build_id = None
+        if self.builds_datastore():
+            self.run_create_data()
+        if self.load_cached_result():
+            return self.emission_per_ha
+        # one read transaction, a build running beside it is seen entirely or not at all
+        with self.reading():
+            self.get_all_input()
         self.get_emissions()
+        self.store_result()
+        return self.emission_per_ha
+
+    @timed("run")
+    async def arun(self, executor: Optional[Executor] = None):
+        """`run` without blocking the event loop, the blocking steps go to `executor`.
+
+        The independent retrievals of `aget_all_input` run at the same time;
+        with `read_only` each of them is its own read transaction."""
+        self.build_id = None
+        if self.builds_datastore():
+            await in_executor(executor, self.run_create_data)
+        # loaded before the concurrent retrievals, which both need it
+        await in_executor(executor, self.datastore_build_id)
+        if await in_executor(executor, self.load_cached_result):
+            return self.emission_per_ha
+        await self.aget_all_input(executor)
+        await in_executor(executor, self.get_emissions)
+        await in_executor(executor, self.store_result)
         return self.emission_per_ha
+
+
+async def arun_all(
+    user_inputs: list[UserInput],
+    run_config: RunConfig,
+    executor: Optional[Executor] = None,
+    limit: int = 8,
+) -> list[pd.DataFrame]:
+    """`emission_per_ha` of every demand, at most `limit` runs at a time.
+
+    The datastore is built once before the runs, which then only read it (or
+    the snapshot)."""
+    if user_inputs:
+        builder = Crop(user_input=user_inputs[0], run_config=run_config)
+        if builder.builds_datastore():
+            await in_executor(executor, builder.run_create_data)
+    reading = run_config.model_copy(update={"read_only": True})
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(user_input):
+        async with semaphore:
+            return await Crop(user_input=user_input, run_config=reading).arun(executor)
+
+    return list(await asyncio.gather(*map(run, user_inputs)))
       
\ No newline at end of file
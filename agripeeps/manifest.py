@@ -0,0 +1,112 @@
+#Build manifest for the local datastore
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+from loguru import logger
+
+import connections
+import instrumentation
+from paths import DATASTORE_DIR
+
+MANIFEST_FORMAT = 1
+MANIFEST_PATH = DATASTORE_DIR / "agripeeps-manifest.json"
+SOURCES = ("yield", "fertiliser", "emission_factors")
+
+
+def frame_checksum(df: pd.DataFrame) -> str:
+    """Content hash of a dataframe, independent of its index."""
+    digest = hashlib.sha256("|".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def file_checksum(path: Path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def dataset_key(source: str, product: str, location: str) -> str:
+    return f"{source}|{product}|{location}"
+
+
+class BuildManifest:
+    """Source checksums and dataset versions of the last datastore build.
+
+    Each dataset written by `create_data` is recorded under
+    `dataset_key(source, product, location)` with the checksum of its dataframe,
+    its version and its row id in the sentier `Dataset` table.
+    """
+
+    def __init__(self, path: Optional[Path] = None, sources: dict = None, datasets: dict = None):
+        self.path = Path(path or MANIFEST_PATH)
+        self.sources = sources or {}
+        self.datasets = datasets or {}
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "BuildManifest":
+        path = Path(path or MANIFEST_PATH)
+        if not path.exists():
+            return cls(path)
+        try:
+            content = json.loads(path.read_text())
+        except ValueError:
+            logger.warning("Ignoring unreadable build manifest {}", path)
+            return cls(path)
+        if content.get("format") != MANIFEST_FORMAT:
+            return cls(path)
+        return cls(path, content["sources"], content["datasets"])
+
+    def save(self) -> None:
+        # written once the datastore transaction commits, so `build_id` never names uncommitted content
+        connections.after_commit(self._write)
+
+    def _write(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        content = {
+            "format": MANIFEST_FORMAT,
+            "build_id": self.build_id,
+            "sources": self.sources,
+            "datasets": self.datasets,
+        }
+        # replaced in one step, readers load either the previous or the new manifest
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(content, indent=2, sort_keys=True))
+        tmp.replace(self.path)
+
+    @property
+    def build_id(self) -> str:
+        """Identifier of the datastore content, changes whenever a dataset is rewritten."""
+        digest = hashlib.sha256()
+        for key in sorted(self.datasets):
+            entry = self.datasets[key]
+            digest.update(f"{key}:{entry['checksum']}:{entry['version']}".encode())
+        return digest.hexdigest()[:16]
+
+    def source_unchanged(self, source: str, checksum: str, existing_ids: set) -> bool:
+        """True if `source` was built from the same content and its datasets are still stored."""
+        return self.sources.get(source, {}).get("checksum") == checksum and all(
+            self.datasets[key]["id"] in existing_ids for key in self.source_keys(source)
+        )
+
+    def set_source(self, source: str, checksum: str, **extra) -> None:
+        self.sources[source] = {"checksum": checksum, **extra}
+
+    def source_keys(self, source: str) -> set:
+        return {key for key in self.datasets if key.split("|", 1)[0] == source}
+
+    def is_complete(self, existing_ids: Optional[set] = None) -> bool:
+        """True if every source was built and all recorded datasets are still stored."""
+        if not all(source in self.sources for source in SOURCES):
+            return False
+        if existing_ids is None:
+            existing_ids = stored_dataset_ids()
+        return all(entry["id"] in existing_ids for entry in self.datasets.values())
+
+
+def stored_dataset_ids() -> set:
+    from sentier_data_tools.local_storage.db import Dataset
+
+    instrumentation.count("db_queries")
+    return {row.id for row in connections.bind(Dataset.select(Dataset.id))}
@@ -0,0 +1,8 @@
+#Directories shared with the sentier local datastore
+from pathlib import Path
+
+import platformdirs
+
+# Same directory as `sentier_data_tools.local_storage.db.sqlite_dir_platformdirs`, computed
+# here so that cache and manifest paths are known without importing `sentier_data_tools`
+DATASTORE_DIR = Path(platformdirs.user_data_dir(appname="sentier.dev", appauthor="DdS")) / "local-data-store"
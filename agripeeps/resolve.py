@@ -0,0 +1,82 @@
+#Vectorized resolution of country codes and crop names to IRIs
+from functools import lru_cache
+from pathlib import Path
+from typing import Mapping, Union
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+GEONAMES_PATH = Path(__file__).parent / "geonames.tsv"
+GEONAMES_BASE = "https://sws.geonames.org/"
+
+CROP_IRIS = {
+    "Wheat": "http://data.europa.eu/xsp/cn2024/100100000080",
+    "Rice": "http://aims.fao.org/aos/agrovoc/c_6599",
+    "Potatoe": "http://data.europa.eu/xsp/cn2024/071010000080",
+    "Potatoes": "http://data.europa.eu/xsp/cn2024/071010000080",
+    "Maize": "http://data.europa.eu/xsp/cn2024/100500000080",
+    "Maize (corn)": "http://data.europa.eu/xsp/cn2024/100500000080"
+}
+
+
+@lru_cache(maxsize=1)
+def geonames_lookup() -> pd.Series:
+    """Geonames IRI per ISO3 code, read once from the packaged `geonames.tsv`."""
+    df = pd.read_csv(GEONAMES_PATH, sep="\t", usecols=["ISO3", "geonameid"], keep_default_na=False)
+    iris = GEONAMES_BASE + df["geonameid"].astype(str)
+    return pd.Series(iris.to_numpy(), index=df["ISO3"].to_numpy())
+
+
+@lru_cache(maxsize=1)
+def fao_iso3_lookup() -> pd.Series:
+    """ISO3 code per FAOSTAT numeric area code."""
+    import country_converter as coco
+
+    data = coco.CountryConverter().data[["FAOcode", "ISO3"]].dropna()
+    data = data[data["FAOcode"].astype(str).str.fullmatch(r"\d+(\.0)?")]
+    return pd.Series(data["ISO3"].to_numpy(), index=data["FAOcode"].astype(float).astype(int).to_numpy())
+
+
+def map_categorical(
+    values: pd.Series, lookup: Union[Mapping, pd.Series], what: str, errors: str = "warn"
+) -> pd.Series:
+    """Map `values` through `lookup` into a categorical column.
+
+    Each distinct value is looked up once. Values without a match become
+    missing and are reported together, as a warning or, with
+    `errors="raise"`, as one `KeyError` listing all of them."""
+    codes, uniques = pd.factorize(values)
+    mapped = pd.Series(uniques).map(lookup)
+    missing = mapped.isna().to_numpy()
+    if missing.any():
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))[missing]
+        unmapped = dict(zip(map(str, uniques[missing]), counts.tolist()))
+        if errors == "raise":
+            raise KeyError(f"Unmapped {what}: {unmapped}")
+        logger.warning("Dropping {} rows with unmapped {}: {}", sum(unmapped.values()), what, unmapped)
+    category_codes, categories = pd.factorize(mapped)
+    if not len(categories):
+        # nothing mapped, `category_codes` may be empty
+        result_codes = np.full(len(codes), -1)
+    else:
+        result_codes = np.where(codes >= 0, category_codes[codes], -1)
+    return pd.Series(
+        pd.Categorical.from_codes(result_codes, categories=categories),
+        index=values.index,
+        name=values.name,
+    )
+
+
+def country_iris(iso3: pd.Series, errors: str = "warn") -> pd.Series:
+    return map_categorical(iso3.astype(str), geonames_lookup(), "ISO3 codes", errors)
+
+
+def fao_country_iris(area_codes: pd.Series, errors: str = "warn") -> pd.Series:
+    """Geonames IRIs for FAOSTAT numeric area codes."""
+    iso3 = map_categorical(pd.to_numeric(area_codes, errors="coerce"), fao_iso3_lookup(), "FAO area codes", errors)
+    return map_categorical(iso3, geonames_lookup(), "ISO3 codes", errors)
+
+
+def crop_iris(names: pd.Series, errors: str = "warn") -> pd.Series:
+    return map_categorical(names, CROP_IRIS, "crop names", errors)
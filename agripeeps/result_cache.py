@@ -0,0 +1,156 @@
+#Content-addressed cache of Crop results
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+from loguru import logger
+
+import instrumentation
+
+# `UserInput` fields that determine `emission_per_ha`
+INPUT_FIELDS = ("product_iri", "spatial_context", "year", "climate_type", "fertilizer_amount", "crop_yield_val")
+# `RunConfig` fields that change the result
+CONFIG_FIELDS = ("emission_models", "num_samples", "seed")
+# frames of a `Crop` run that are cached
+FRAMES = ("emission_per_ha", "emission_percentiles")
+MAXSIZE = 1024
+TTL = 24 * 3600
+DISK_MAX_BYTES = 256 * 2**20
+# directory of the disk tier, no disk tier if unset
+RESULT_DIR = os.environ.get("AGRIPEEPS_RESULT_DIR")
+
+
+def result_key(user_input, run_config, build_id: Optional[str]) -> str:
+    """Hash of the result-determining fields of a demand and run config, and the datastore build."""
+    content = {
+        "input": {field: getattr(user_input, field) for field in INPUT_FIELDS},
+        "config": {field: getattr(run_config, field, None) for field in CONFIG_FIELDS},
+        "build_id": build_id,
+    }
+    # years are strings in `UserInput` but often given as numbers
+    if content["input"]["year"] is not None:
+        content["input"]["year"] = str(content["input"]["year"])
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResultCache:
+    """Results of `Crop` runs by `result_key`, in memory and optionally on disk.
+
+    The memory tier keeps the `maxsize` most recently used results. The disk
+    tier under `path` stores each frame as `<key>.<frame>.parquet` and drops
+    the least recently written results beyond `max_bytes`. Entries older than `ttl` seconds are
+    ignored in both tiers. Results are returned as copies."""
+
+    def __init__(
+        self,
+        maxsize: int = MAXSIZE,
+        ttl: float = TTL,
+        path: Optional[Path] = None,
+        max_bytes: int = DISK_MAX_BYTES,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = None if path is None else Path(path)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            instrumentation.count("result_cache_hits")
+            return copy_frames(entry[1])
+
+        frames = self._read(key)
+        if frames is None:
+            instrumentation.count("result_cache_misses")
+            return None
+        instrumentation.count("result_cache_disk_hits")
+        self._remember(key, frames)
+        return copy_frames(frames)
+
+    def put(self, key: str, frames: dict) -> None:
+        """Store the frames of one result, `None` frames are left out."""
+        frames = copy_frames({name: df for name, df in frames.items() if df is not None})
+        self._remember(key, frames)
+        if self.path is not None:
+            self._write(key, frames)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.path is not None:
+            for file in self.path.glob("*.parquet"):
+                file.unlink(missing_ok=True)
+
+    def _remember(self, key: str, frames: dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), frames)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _files(self, key: str) -> list[Path]:
+        return sorted(self.path.glob(f"{key}.*.parquet"))
+
+    def _read(self, key: str) -> Optional[dict]:
+        if self.path is None:
+            return None
+        files = self._files(key)
+        try:
+            if not files or any(time.time() - file.stat().st_mtime >= self.ttl for file in files):
+                return None
+            return {file.name.split(".")[1]: pd.read_parquet(file) for file in files}
+        except (OSError, ValueError) as err:
+            logger.warning("Ignoring unreadable cached result {}: {}", key, err)
+            return None
+
+    def _write(self, key: str, frames: dict) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        for name, df in frames.items():
+            target = self.path / f"{key}.{name}.parquet"
+            tmp = target.with_suffix(".tmp")
+            df.to_parquet(tmp, compression="zstd")
+            tmp.replace(target)
+        self._evict()
+
+    def _evict(self) -> None:
+        # whole results go, least recently written first
+        results = {}
+        for file in self.path.glob("*.parquet"):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            written, size, files = results.get(file.name.split(".")[0], (0, 0, []))
+            results[file.name.split(".")[0]] = (max(written, stat.st_mtime), size + stat.st_size, files + [file])
+        total = sum(size for _, size, _ in results.values())
+        for _, size, files in sorted(results.values(), key=lambda result: result[0]):
+            if total <= self.max_bytes:
+                break
+            total -= size
+            for file in files:
+                file.unlink(missing_ok=True)
+
+
+def copy_frames(frames: dict) -> dict:
+    return {name: df.copy() for name, df in frames.items()}
+
+
+@lru_cache(maxsize=1)
+def result_cache() -> ResultCache:
+    return ResultCache(path=RESULT_DIR)
@@ -0,0 +1,219 @@
+#Columnar snapshot of the local datastore
+import json
+import shutil
+from collections import defaultdict
+from datetime import date
+from functools import cached_property, lru_cache
+from pathlib import Path
+from typing import Iterator, Optional, Union
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+import connections
+import ingest
+from lazy import lazy_import
+from manifest import BuildManifest, stored_dataset_ids
+
+sdt = lazy_import("sentier_data_tools")
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_NAME = "snapshot.json"
+# names of the `DatasetKind` members included in a snapshot
+KINDS = ("BOM", "PARAMETERS")
+
+
+def partition_dir(kind: "sdt.DatasetKind", product: str, location: str) -> Path:
+    """Hive-style `kind=/product=/location=` directory, IRIs percent-encoded."""
+    return (
+        Path(f"kind={kind.name}")
+        / f"product={quote(str(product), safe='')}"
+        / f"location={quote(str(location), safe='')}"
+    )
+
+
+def export_snapshot(path: Union[Path, str], manifest: Optional[BuildManifest] = None) -> Path:
+    """Write every BOM and PARAMETERS dataset to a partitioned Parquet snapshot at `path`.
+
+    Each dataset becomes one uncompressed Parquet file under `partition_dir`,
+    the dataset fields and the build manifest go to `snapshot.json`. The
+    snapshot is written next to `path` and moved in place at the end, the
+    previous one moved aside first and removed after, so readers see either
+    snapshot and never a partial one."""
+    path = Path(path)
+    manifest = manifest or BuildManifest.load()
+    recorded = {entry["id"]: (key, entry["checksum"]) for key, entry in manifest.datasets.items()}
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    entries = []
+    Dataset = sdt.Dataset
+    kinds = [sdt.DatasetKind[name] for name in KINDS]
+    for dataset in connections.bind(Dataset.select().where(Dataset.kind << kinds).order_by(Dataset.id)):
+        relative = partition_dir(dataset.kind, dataset.product, dataset.location) / f"part-{dataset.id}.parquet"
+        (tmp / relative).parent.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(dataset.dataframe, preserve_index=False)
+        pq.write_table(table, tmp / relative, compression="none")
+        key, checksum = recorded.get(dataset.id, (None, None))
+        entries.append(
+            {
+                "path": relative.as_posix(),
+                "key": key,
+                "checksum": checksum,
+                "name": dataset.name,
+                "kind": dataset.kind.name,
+                "product": str(dataset.product),
+                "location": str(dataset.location),
+                "valid_from": dataset.valid_from.isoformat(),
+                "valid_to": dataset.valid_to.isoformat(),
+                "columns": dataset.columns,
+                "metadata": dataset.metadata,
+                "version": dataset.version,
+                "rows": table.num_rows,
+            }
+        )
+
+    content = {
+        "format": SNAPSHOT_FORMAT,
+        "build_id": manifest.build_id,
+        "sources": manifest.sources,
+        "datasets": entries,
+    }
+    (tmp / MANIFEST_NAME).write_text(json.dumps(content, indent=2, sort_keys=True))
+    old = path.with_name(path.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if path.exists():
+        path.rename(old)
+    tmp.rename(path)
+    shutil.rmtree(old, ignore_errors=True)
+    logger.info("Exported {} datasets of build {} to {}", len(entries), manifest.build_id, path)
+    return path
+
+
+class Snapshot:
+    """Read side of a snapshot written by `export_snapshot`.
+
+    Only `snapshot.json` is read on `open`; a partition is read, through a
+    memory map, when its table is first needed. Parquet is decoded on read, so
+    each process holds its own copy of the dataframes it uses."""
+
+    def __init__(self, path: Path, content: dict):
+        self.path = Path(path)
+        self.build_id = content["build_id"]
+        self.sources = content["sources"]
+        self.entries = content["datasets"]
+        self._by_product = defaultdict(list)
+        for entry in self.entries:
+            self._by_product[(entry["kind"], entry["product"])].append(entry)
+
+    @classmethod
+    def open(cls, path: Union[Path, str]) -> "Snapshot":
+        content = json.loads((Path(path) / MANIFEST_NAME).read_text())
+        if content.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {content.get('format')} in {path}")
+        return cls(path, content)
+
+    def select(
+        self,
+        kind: Optional["sdt.DatasetKind"] = None,
+        product: Optional[str] = None,
+        location: Optional[str] = None,
+    ) -> list[dict]:
+        return [
+            entry
+            for entry in self.entries
+            if (kind is None or entry["kind"] == kind.name)
+            and (product is None or entry["product"] == str(product))
+            and (location is None or entry["location"] == str(location))
+        ]
+
+    def table(self, entry: dict) -> pa.Table:
+        return pq.read_table(self.path / entry["path"], memory_map=True)
+
+    def dataframe(self, entry: dict) -> pd.DataFrame:
+        # the table is not reused, its buffers are released column by column
+        return self.table(entry).to_pandas(split_blocks=True, self_destruct=True)
+
+    def frames(self, kind: Optional["sdt.DatasetKind"] = None) -> Iterator[tuple[dict, pd.DataFrame]]:
+        for entry in self.select(kind):
+            yield entry, self.dataframe(entry)
+
+    def datasets(self, kind: "sdt.DatasetKind", products) -> list["SnapshotDataset"]:
+        """Datasets of `kind` for any of `products`, in place of a `Dataset` query."""
+        return [
+            SnapshotDataset(self, entry)
+            for product in products
+            for entry in self._by_product.get((kind.name, str(product)), [])
+        ]
+
+
+class SnapshotDataset:
+    """The `Dataset` fields `example.base` reads, the dataframe read when first used."""
+
+    def __init__(self, snapshot: Snapshot, entry: dict):
+        self.snapshot = snapshot
+        self.entry = entry
+        self.name = entry["name"]
+        self.product = entry["product"]
+        self.location = entry["location"]
+        self.valid_from = date.fromisoformat(entry["valid_from"])
+        self.valid_to = date.fromisoformat(entry["valid_to"])
+
+    @cached_property
+    def dataframe(self) -> pd.DataFrame:
+        return self.snapshot.dataframe(self.entry)
+
+
+def open_snapshot(path: str) -> Snapshot:
+    """`Snapshot.open`, once per path and process until the snapshot is exported again."""
+    return _open_snapshot(path, (Path(path) / MANIFEST_NAME).stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=8)
+def _open_snapshot(path: str, modified: int) -> Snapshot:
+    return Snapshot.open(path)
+
+
+def import_snapshot(path: Union[Path, str], manifest_path: Optional[Path] = None) -> BuildManifest:
+    """Replace the BOM and PARAMETERS datasets of the local datastore with a snapshot.
+
+    Returns the new build manifest. Nothing is written if the local datastore
+    already holds the snapshot build. Datasets of other kinds are kept."""
+    snapshot = Snapshot.open(path)
+    current = BuildManifest.load(manifest_path)
+    if current.build_id == snapshot.build_id and current.is_complete(stored_dataset_ids()):
+        logger.info("Local datastore already at snapshot build {}", snapshot.build_id)
+        return current
+
+    records = [
+        dict(
+            name=entry["name"],
+            dataframe=snapshot.dataframe(entry),
+            kind=sdt.DatasetKind[entry["kind"]],
+            product=entry["product"],
+            location=entry["location"],
+            valid_from=date.fromisoformat(entry["valid_from"]),
+            valid_to=date.fromisoformat(entry["valid_to"]),
+            columns=entry["columns"],
+            metadata=entry["metadata"],
+            version=entry["version"],
+        )
+        for entry in snapshot.entries
+    ]
+    manifest = BuildManifest(current.path, sources=dict(snapshot.sources))
+    with connections.writing():
+        sdt.Dataset.delete().where(sdt.Dataset.kind << [sdt.DatasetKind[name] for name in KINDS]).execute()
+        ids = ingest.bulk_insert(records)
+    for entry, dataset_id in zip(snapshot.entries, ids):
+        if entry["key"] is not None:
+            manifest.datasets[entry["key"]] = {
+                "checksum": entry["checksum"],
+                "version": entry["version"],
+                "id": dataset_id,
+            }
+    manifest.save()
+    logger.info("Imported {} datasets of build {}", len(ids), manifest.build_id)
+    return manifest
@@ -0,0 +1,223 @@
+#Cached access to the remote FUBC and FAOSTAT sources
+import email.utils
+import hashlib
+import io
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Callable, Optional
+
+import pandas as pd
+from loguru import logger
+
+from manifest import frame_checksum
+from paths import DATASTORE_DIR
+
+FUBC_URL = "https://raw.githubusercontent.com/ludemannc/FUBC_1_to_9_2022/refs/heads/main/results/FUBC_1_to_9_data.csv"
+# raw downloads, stored as `<checksum>.parquet` next to an `index.json`
+CACHE_DIR = DATASTORE_DIR / "agripeeps-sources"
+# cached downloads younger than this are used without asking the server
+MAX_AGE = 24 * 3600
+TIMEOUT = 60
+# serve only from the cache, never touch the network
+OFFLINE = os.environ.get("AGRIPEEPS_OFFLINE", "") not in ("", "0")
+# directory of `<name>.csv` files that stand in for the remote sources
+SOURCE_DIR = os.environ.get("AGRIPEEPS_SOURCE_DIR")
+
+
+class SourceUnavailable(RuntimeError):
+    """A source is neither reachable nor cached."""
+
+
+class SourceCache:
+    """Content-addressed store of raw source tables.
+
+    Every table is written once as zstd-compressed Parquet under its content
+    checksum. `index.json` maps source names to their current checksum, the
+    HTTP validators (`etag`, `last_modified`) and the time of the last check.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or CACHE_DIR)
+        self.index_path = self.path / "index.json"
+        self.index = self._load_index()
+
+    def _load_index(self) -> dict:
+        if not self.index_path.exists():
+            return {}
+        try:
+            return json.loads(self.index_path.read_text())
+        except ValueError:
+            logger.warning("Ignoring unreadable source cache index {}", self.index_path)
+            return {}
+
+    def _save_index(self) -> None:
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.index, indent=2, sort_keys=True))
+        tmp.replace(self.index_path)
+
+    def blob_path(self, checksum: str) -> Path:
+        return self.path / f"{checksum}.parquet"
+
+    def entry(self, name: str) -> Optional[dict]:
+        entry = self.index.get(name)
+        if entry and self.blob_path(entry["checksum"]).exists():
+            return entry
+        return None
+
+    def is_fresh(self, name: str, max_age: float) -> bool:
+        entry = self.entry(name)
+        return entry is not None and time.time() - entry["checked"] < max_age
+
+    def read(self, name: str) -> pd.DataFrame:
+        return pd.read_parquet(self.blob_path(self.index[name]["checksum"]))
+
+    def write(self, name: str, df: pd.DataFrame, **validators) -> str:
+        """Store `df` as the current content of `name`, returns its checksum."""
+        checksum = frame_checksum(df)
+        blob = self.blob_path(checksum)
+        if not blob.exists():
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_suffix(".tmp")
+            df.to_parquet(tmp, compression="zstd", index=False)
+            tmp.replace(blob)
+        previous = self.index.get(name, {}).get("checksum")
+        self.index[name] = {"checksum": checksum, "checked": time.time(), **validators}
+        self._save_index()
+        if previous and previous != checksum:
+            self._prune(previous)
+        return checksum
+
+    def touch(self, name: str) -> None:
+        """Record that the cached content of `name` was confirmed current."""
+        self.index[name]["checked"] = time.time()
+        self._save_index()
+
+    def _prune(self, checksum: str) -> None:
+        if all(entry["checksum"] != checksum for entry in self.index.values()):
+            self.blob_path(checksum).unlink(missing_ok=True)
+
+
+def cached_source(
+    name: str,
+    download: Callable[[Optional[dict]], Optional[tuple]],
+    refresh: bool = False,
+    max_age: Optional[float] = None,
+    cache: Optional[SourceCache] = None,
+) -> pd.DataFrame:
+    """Table `name` from the cache, downloading it only when needed.
+
+    `download` receives the cache entry (or `None`) and returns either `None`
+    when the cached copy is still current, or `(df, validators)`. The download
+    is skipped while the cached copy is younger than `max_age`, unless
+    `refresh` is set; offline, or when the download fails, the cached copy is
+    used regardless of its age."""
+    cache = cache or SourceCache()
+    max_age = MAX_AGE if max_age is None else max_age
+    entry = cache.entry(name)
+    if entry is not None and not refresh and cache.is_fresh(name, max_age):
+        return cache.read(name)
+    if OFFLINE:
+        if entry is None:
+            raise SourceUnavailable(f"{name} is not cached and agripeeps is offline")
+        logger.info("Offline, using cached {}", name)
+        return cache.read(name)
+
+    try:
+        downloaded = download(entry)
+    except (OSError, urllib.error.URLError) as err:
+        if entry is None:
+            raise SourceUnavailable(f"Could not download {name}: {err}") from err
+        logger.warning("Could not download {}, using cached copy: {}", name, err)
+        return cache.read(name)
+    if downloaded is None:
+        logger.debug("{} not modified", name)
+        cache.touch(name)
+        return cache.read(name)
+    df, validators = downloaded
+    cache.write(name, df, **validators)
+    logger.info("Downloaded {} ({} rows)", name, len(df))
+    return df
+
+
+def local_source(name: str) -> Optional[Path]:
+    if SOURCE_DIR is None:
+        return None
+    path = Path(SOURCE_DIR) / f"{name}.csv"
+    if not path.exists():
+        raise SourceUnavailable(f"{path} not found in the local source directory")
+    return path
+
+
+def fetch_csv(name: str, url: str, refresh: bool = False, max_age: Optional[float] = None, **read_csv) -> pd.DataFrame:
+    """CSV table at `url`, revalidated with `If-None-Match`/`If-Modified-Since`."""
+    path = local_source(name)
+    if path is not None:
+        return pd.read_csv(path, **read_csv)
+
+    def download(entry):
+        request = urllib.request.Request(url)
+        if entry and entry.get("etag"):
+            request.add_header("If-None-Match", entry["etag"])
+        if entry and entry.get("last_modified"):
+            request.add_header("If-Modified-Since", entry["last_modified"])
+        try:
+            with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+                content = response.read()
+                validators = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified")
+                    or email.utils.formatdate(usegmt=True),
+                }
+        except urllib.error.HTTPError as err:
+            if err.code == 304 and entry is not None:
+                return None
+            raise
+        return pd.read_csv(io.BytesIO(content), **read_csv), validators
+
+    return cached_source(name, download, refresh=refresh, max_age=max_age)
+
+
+def fetch_faostat(
+    dataset_code: str,
+    element: str,
+    items: list,
+    years: list,
+    refresh: bool = False,
+    max_age: Optional[float] = None,
+) -> pd.DataFrame:
+    """FAOSTAT `dataset_code` rows for `element`, `items` and `years` (all years if empty).
+
+    The FAOSTAT API has no conditional requests, so a stale copy is downloaded
+    again in full; only the content checksum decides whether the datastore
+    needs rebuilding. A local source directory provides `faostat-<code>.csv`
+    with all elements, items and years, filtered here."""
+    path = local_source(f"faostat-{dataset_code}")
+    if path is not None:
+        data = pd.read_csv(path)
+        selected = data["Element"].eq(element) & data["Item"].isin(items)
+        if years:
+            selected &= data["Year"].astype(str).isin([str(year) for year in years])
+        return data[selected].reset_index(drop=True)
+
+    query = json.dumps([element, sorted(items), sorted(map(str, years))])
+    name = f"faostat-{dataset_code}-{hashlib.sha256(query.encode()).hexdigest()[:12]}"
+
+    def download(entry):
+        import faostat
+
+        element_number = faostat.get_par(dataset_code, "element")[element]
+        item_values = faostat.get_par(dataset_code, "items")
+        data = faostat.get_data_df(
+            dataset_code,
+            pars={"element": element_number,
+                  "item": [item_values[item] for item in items],
+                  "year": years},
+            coding={"area_cs": "ISO3"}
+        )
+        return data, {"query": query}
+
+    return cached_source(name, download, refresh=refresh, max_age=max_age)
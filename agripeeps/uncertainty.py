@@ -0,0 +1,119 @@
+#Monte Carlo propagation of emission factor, fertiliser and yield uncertainty
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from DirectFertiliserEmission import M2_PER_HA, n2o_emission
+
+PERCENTILES = (2.5, 50, 97.5)
+# upper bound on the number of samples held in memory per drawn quantity
+MAX_CHUNK_ELEMENTS = 2**22
+
+
+def as_generator(rng: Union[np.random.Generator, int, None]) -> np.random.Generator:
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def ef_sd(ef_min: np.ndarray, ef_max: np.ndarray) -> np.ndarray:
+    # the IPCC range is read as a 95% interval, as in the archived `_run`
+    return (np.asarray(ef_max, dtype=float) - np.asarray(ef_min, dtype=float)) / 4
+
+
+def draw(mean: np.ndarray, sd: np.ndarray, num_samples: int, rng: np.random.Generator) -> np.ndarray:
+    """Non-negative normal draws of shape (len(mean), num_samples)."""
+    mean = np.asarray(mean, dtype=float)[:, None]
+    sd = np.broadcast_to(np.asarray(sd, dtype=float), mean.shape[:1])[:, None]
+    samples = rng.standard_normal((mean.shape[0], num_samples))
+    samples *= sd
+    samples += mean
+    return np.maximum(samples, 0, out=samples)
+
+
+def sample_n2o(
+    fertiliser: np.ndarray,
+    ef_value: np.ndarray,
+    ef_min: np.ndarray,
+    ef_max: np.ndarray,
+    num_samples: int,
+    crop_yield: Optional[np.ndarray] = None,
+    fertiliser_cv: float = 0.0,
+    yield_cv: float = 0.0,
+    rng: Union[np.random.Generator, int, None] = None,
+    percentiles: tuple = PERCENTILES,
+    chunk_size: Optional[int] = None,
+) -> dict[str, np.ndarray]:
+    """Percentiles of N2O emissions per demand, drawn `num_samples` times.
+
+    All inputs hold one value per demand (fertiliser and yield in kg/m2).
+    Demands are processed in chunks of `chunk_size` rows so that at most
+    `chunk_size * num_samples` draws per quantity are in memory. Returns arrays
+    of shape (demands, len(percentiles)) for `N2O emission per ha` and, if
+    `crop_yield` is given, `N2O emission per kg`.
+    """
+    rng = as_generator(rng)
+    fertiliser = np.asarray(fertiliser, dtype=float)
+    ef_value = np.asarray(ef_value, dtype=float)
+    ef_spread = ef_sd(ef_min, ef_max)
+    n = len(fertiliser)
+    if chunk_size is None:
+        chunk_size = max(1, MAX_CHUNK_ELEMENTS // max(num_samples, 1))
+
+    per_ha = np.empty((n, len(percentiles)))
+    per_kg = np.empty((n, len(percentiles))) if crop_yield is not None else None
+    for start in range(0, n, chunk_size):
+        rows = slice(start, min(start + chunk_size, n))
+        emission = draw(ef_value[rows], ef_spread[rows], num_samples, rng)
+        drawn_fertiliser = draw(fertiliser[rows], fertiliser[rows] * fertiliser_cv, num_samples, rng)
+        n2o_emission(drawn_fertiliser, emission, out=emission)
+        if per_kg is not None:
+            yields = np.asarray(crop_yield, dtype=float)[rows]
+            drawn_yield = draw(yields, yields * yield_cv, num_samples, rng)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                per_kg[rows] = np.percentile(emission / drawn_yield, percentiles, axis=1).T
+        emission *= M2_PER_HA
+        per_ha[rows] = np.percentile(emission, percentiles, axis=1).T
+
+    result = {"N2O emission per ha": per_ha}
+    if per_kg is not None:
+        result["N2O emission per kg"] = per_kg
+    return result
+
+
+def emission_percentiles(
+    emissions: pd.DataFrame,
+    num_samples: int,
+    rng: Union[np.random.Generator, int, None] = None,
+    percentiles: tuple = PERCENTILES,
+    **kwargs,
+) -> pd.DataFrame:
+    """Monte Carlo percentiles for the long output of `batch.run_batch` or `Crop.get_emissions`.
+
+    `emissions` has one row per demand and `value_type` (value/min/max). Returns
+    one row per demand with a column per quantity and percentile."""
+    if "demand" not in emissions.columns:
+        emissions = emissions.assign(demand=0)
+    wide = emissions.pivot_table(
+        index="demand", columns="value_type", values="emission_factor", aggfunc="first"
+    )
+    input_columns = [col for col in ("fertiliser_input", "crop_yield") if col in emissions.columns]
+    inputs = emissions.groupby("demand")[input_columns].first().reindex(wide.index)
+    sampled = sample_n2o(
+        fertiliser=inputs["fertiliser_input"].to_numpy(dtype=float),
+        ef_value=wide["value"].to_numpy(),
+        ef_min=wide["min"].to_numpy(),
+        ef_max=wide["max"].to_numpy(),
+        num_samples=num_samples,
+        crop_yield=inputs["crop_yield"].to_numpy(dtype=float) if "crop_yield" in inputs else None,
+        rng=rng,
+        percentiles=percentiles,
+        **kwargs,
+    )
+    columns = {
+        f"{name} p{q:g}": values[:, i]
+        for name, values in sampled.items()
+        for i, q in enumerate(percentiles)
+    }
+    return pd.DataFrame(columns, index=wide.index)
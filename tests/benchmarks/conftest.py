@@ -0,0 +1,109 @@
+"""Benchmark fixtures for agripeeps
+
+Run with `pytest tests/benchmarks`; they are not part of the default test paths.
+Synthetic datasets cover `AGRIPEEPS_BENCH_SIZE` crops x countries x years
+(default "6x40x10"). Medians are compared in units of a fixed pandas workload
+timed in the same session, so the baselines carry over between machines. Each
+benchmark fails when its relative median is more than `AGRIPEEPS_BENCH_TOLERANCE`
+(default 0.5, i.e. 50%) above the baseline in `baseline.json` for that size;
+`AGRIPEEPS_BENCH_UPDATE=1` records new baselines.
+"""
+
+import json
+import os
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..conftest import BROADER, CROP, MAIZE, WHEAT, source_frame
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+SIZE = tuple(int(n) for n in os.environ.get("AGRIPEEPS_BENCH_SIZE", "6x40x10").split("x"))
+TOLERANCE = float(os.environ.get("AGRIPEEPS_BENCH_TOLERANCE", "0.5"))
+UPDATE = os.environ.get("AGRIPEEPS_BENCH_UPDATE", "") not in ("", "0")
+
+
+def synthetic_crops(n: int) -> list[str]:
+    extra = [f"http://data.europa.eu/xsp/cn2024/1{i:03d}00000080" for i in range(max(n - 2, 0))]
+    return [MAIZE, WHEAT, *extra][:n]
+
+
+def synthetic_countries(n: int) -> list[str]:
+    return [f"https://sws.geonames.org/{3000000 + i}" for i in range(n)]
+
+
+def synthetic_years(n: int) -> list[str]:
+    return [str(2018 - i) for i in range(n)]
+
+
+@pytest.fixture
+def size():
+    crops, countries, years = SIZE
+    return {
+        "crops": synthetic_crops(crops),
+        "countries": synthetic_countries(countries),
+        "years": synthetic_years(years),
+    }
+
+
+@pytest.fixture
+def synthetic_sources(size, monkeypatch):
+    """FUBC and FAO stand-in tables of the benchmark size, all crops below `CROP`."""
+    import create_data
+
+    for crop in size["crops"]:
+        monkeypatch.setitem(BROADER, crop, [CROP])
+    frames = {
+        "fertiliser": source_frame(size["crops"], size["countries"], size["years"], "N_kg_m2", 0.01),
+        "yield": source_frame(size["crops"], size["countries"], size["years"], "Value", 0.9),
+    }
+    monkeypatch.setattr(create_data, "create_mineral_fertilizer_data", lambda refresh=False: frames["fertiliser"].copy())
+    monkeypatch.setattr(create_data, "create_crop_yields_data", lambda refresh=False: frames["yield"].copy())
+    return frames
+
+
+@pytest.fixture
+def synthetic_datastore(local_db, synthetic_sources):
+    import create_data
+
+    return create_data.build_local_datastorage()
+
+
+def reference_workload():
+    df = pd.DataFrame({"key": np.arange(20_000) % 97, "value": np.arange(20_000, dtype=float)})
+    merged = df.merge(df.groupby("key", as_index=False)["value"].sum(), on="key")
+    return merged.sort_values("value_y").to_dict("records")[:1]
+
+
+@pytest.fixture(scope="session")
+def reference_time() -> float:
+    """Fastest of several runs of `reference_workload` on this machine, in seconds."""
+    return min(timeit.repeat(reference_workload, number=1, repeat=7))
+
+
+def load_baselines() -> dict:
+    if not BASELINE_PATH.exists():
+        return {}
+    return json.loads(BASELINE_PATH.read_text())
+
+
+@pytest.fixture
+def bench(benchmark, request, reference_time):
+    """`benchmark` that is compared against the stored baseline once it has run."""
+    yield benchmark
+    if benchmark.disabled or benchmark.stats is None:
+        return
+    key = f"{request.node.name}@{'x'.join(map(str, SIZE))}"
+    median = benchmark.stats.stats.median / reference_time
+    baselines = load_baselines()
+    if UPDATE:
+        baselines[key] = median
+        BASELINE_PATH.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+    elif key in baselines and median > baselines[key] * (1 + TOLERANCE):
+        pytest.fail(
+            f"{key} regressed: median {median:.2f}x the reference workload against baseline {baselines[key]:.2f}x",
+            pytrace=False,
+        )
@@ -0,0 +1,66 @@
+from sentier_data_tools import DatasetKind, GeonamesIRI, ProductIRI
+
+import create_data
+import function as fct
+from example.base import get_model_data, merge_datasets
+from main import Crop, RunConfig, UserInput
+
+from ..conftest import CROP, MAIZE
+
+
+def test_find_match_iri(bench, size, synthetic_sources):
+    candidates = [CROP, *size["crops"][1:]]
+    iris = [f"{crop}?{i}" for crop in size["crops"] for i in range(50)] + size["crops"]
+
+    def setup():
+        fct.iri_matcher.cache_clear()
+        return (), {}
+
+    def match():
+        return [fct.find_match_IRI(iri, candidates) for iri in iris]
+
+    bench.pedantic(match, setup=setup, rounds=20)
+
+
+def test_format_df(bench, synthetic_sources):
+    frame = synthetic_sources["fertiliser"][["CropIRI", "Country", "N_kg_m2"]]
+
+    def setup():
+        fct.intern_iri.cache_clear()
+        return (frame.copy(),), {}
+
+    bench.pedantic(lambda df: fct.format_df(df, ["CropIRI", "Country"]), setup=setup, rounds=20)
+
+
+def test_create_data_writers(bench, local_db, synthetic_sources):
+    bench.pedantic(lambda: create_data.build_local_datastorage(rebuild=True), rounds=3)
+
+
+def test_get_model_data(bench, synthetic_datastore):
+    results = bench(get_model_data, ProductIRI(MAIZE), DatasetKind.PARAMETERS)
+    assert results["exactMatch"]
+
+
+def test_merge_datasets(bench, synthetic_datastore):
+    datasets = get_model_data(ProductIRI(MAIZE), DatasetKind.PARAMETERS)["exactMatch"]
+    merged = bench(merge_datasets, datasets)
+    assert len(merged)
+
+
+def test_crop_inputs_and_emissions(bench, size, synthetic_datastore):
+    user_input = UserInput(
+        product_iri=ProductIRI(MAIZE),
+        unit=ProductIRI("https://vocab.sentier.dev/units/unit/KiloGM"),
+        amount=1,
+        spatial_context=GeonamesIRI(size["countries"][-1]),
+        year=size["years"][-1],
+    )
+    crop = Crop(user_input=user_input, run_config=RunConfig(num_samples=1000, seed=1))
+
+    def inputs_and_emissions():
+        crop.get_all_input()
+        crop.get_emissions()
+        return crop.emission_per_ha
+
+    result = bench(inputs_and_emissions)
+    assert len(result) == 3
@@ -1,3 +1,108 @@
 """Fixtures for agripeeps"""
 
-# import pytest
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# The agripeeps modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).parent.parent / "agripeeps"))
+
+CROP = "http://data.europa.eu/xsp/cn2024/060011000090"
+MAIZE = "http://data.europa.eu/xsp/cn2024/100500000080"
+WHEAT = "http://data.europa.eu/xsp/cn2024/100100000080"
+FRANCE = "https://sws.geonames.org/3017382"
+GERMANY = "https://sws.geonames.org/2921044"
+
+# Small stand-in for the sentier product vocabulary, child -> broader terms
+BROADER = {MAIZE: [CROP], WHEAT: [CROP]}
+
+
+@pytest.fixture(autouse=True)
+def offline_vocab(monkeypatch, tmp_path):
+    """Answer `broader`/`narrower` from `BROADER` instead of the sentier SPARQL endpoint."""
+    from sentier_data_tools.iri import VocabIRI
+
+    import iri_hierarchy
+
+    monkeypatch.setattr(iri_hierarchy, "CACHE_PATH", tmp_path / "iri-hierarchy.json")
+    iri_hierarchy.hierarchy_index.cache_clear()
+    iri_hierarchy.expand_terms.cache_clear()
+
+    def broader(self, include_self=False, raw_strings=False):
+        found = ([str(self)] if include_self else []) + BROADER.get(str(self), [])
+        return found if raw_strings else [self.__class__(elem) for elem in found]
+
+    def narrower(self, include_self=False, raw_strings=False):
+        found = ([str(self)] if include_self else []) + [
+            child for child, parents in BROADER.items() if str(self) in parents
+        ]
+        return found if raw_strings else [self.__class__(elem) for elem in found]
+
+    monkeypatch.setattr(VocabIRI, "broader", broader)
+    monkeypatch.setattr(VocabIRI, "narrower", narrower)
+    monkeypatch.setattr(VocabIRI, "display", lambda self: f"<{self}>")
+
+
+@pytest.fixture
+def local_db(tmp_path, monkeypatch):
+    """Empty sentier datastore and build manifest in a temporary directory."""
+    from playhouse.sqlite_ext import SqliteExtDatabase
+    from sentier_data_tools.local_storage.db import Dataset
+
+    import manifest
+
+    monkeypatch.setattr(manifest, "MANIFEST_PATH", tmp_path / "manifest.json")
+    db = SqliteExtDatabase(tmp_path / "datasets.db")
+    with db.bind_ctx([Dataset]):
+        db.create_tables([Dataset])
+        yield db
+    db.close()
+
+
+def source_frame(crops, countries, years, value_column, value):
+    rows = [
+        {"Datasource": "FAO", "Year": year, "Country": country, "CropIRI": crop, value_column: value}
+        for crop in crops
+        for country in countries
+        for year in years
+    ]
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def sources(monkeypatch):
+    """Synthetic FUBC fertiliser and FAO yield tables in place of the downloads."""
+    import create_data
+
+    frames = {
+        "fertiliser": source_frame([MAIZE, WHEAT], [FRANCE, GERMANY], ["2017", "2018"], "N_kg_m2", 0.01),
+        "yield": source_frame([MAIZE, WHEAT], [FRANCE, GERMANY], ["2017", "2018"], "Value", 0.9),
+    }
+    monkeypatch.setattr(create_data, "create_mineral_fertilizer_data", lambda refresh=False: frames["fertiliser"].copy())
+    monkeypatch.setattr(create_data, "create_crop_yields_data", lambda refresh=False: frames["yield"].copy())
+    return frames
+
+
+@pytest.fixture
+def datastore(local_db, sources):
+    import create_data
+
+    return create_data.build_local_datastorage()
+
+
+@pytest.fixture
+def crop():
+    from sentier_data_tools import GeonamesIRI, ProductIRI
+
+    from main import Crop, RunConfig, UserInput
+
+    user_input = UserInput(
+        product_iri=ProductIRI(MAIZE),
+        unit=ProductIRI("https://vocab.sentier.dev/units/unit/KiloGM"),
+        amount=7,
+        spatial_context=GeonamesIRI(FRANCE),
+        year="2018",
+    )
+    return Crop(user_input=user_input, run_config=RunConfig(num_samples=100, seed=1))
@@ -1,5 +1,30 @@
-from agripeeps.n2OToAirInorganicFertiliserDirect import run
+import numpy as np
+import pytest
+
+from agripeeps.archive.n2OToAirInorganicFertiliserDirect import (
+    TermTermType,
+    climate_codes,
+    get_N2O_factors,
+    run,
+    run_batch,
+)
 
 def test_run():
     run(1,"wet")
 
+
+def test_run_batch_matches_run():
+    n_totals = np.array([1.0, 50.0, 120.0])
+    wet_climates = ["wet", "dry", None]
+    result = run_batch(n_totals, climate_codes(wet_climates))
+
+    for i, (n_total, wet_climate) in enumerate(zip(n_totals, wet_climates)):
+        (expected,) = run(n_total, wet_climate)
+        for field in ("value", "min", "max", "sd"):
+            assert result[field][i] == pytest.approx(expected[field][0])
+
+
+def test_run_batch_term_types():
+    factors, _ = get_N2O_factors(TermTermType.ORGANICFERTILISER, "wet")
+    result = run_batch([28.0], climate_codes(["wet"]), TermTermType.ORGANICFERTILISER)
+    assert result["value"][0] == pytest.approx(44 * factors["value"])
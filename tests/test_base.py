@@ -0,0 +1,96 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from sentier_data_tools import DatasetKind, ProductIRI
+
+from example.base import dataset_frames, get_model_data, merge_datasets
+
+from .conftest import CROP, MAIZE
+
+
+def dataset(location, **columns):
+    return SimpleNamespace(
+        dataframe=pd.DataFrame(columns), location=location, valid_from=date(2000, 1, 1)
+    )
+
+
+def test_merge_datasets_keeps_metadata_and_input():
+    lst = [
+        dataset("https://sws.geonames.org/1", year=["2017", "2018"], value=[1.0, 2.0]),
+        dataset("https://sws.geonames.org/2", year=["2018"], value=[3.0]),
+    ]
+    merged = merge_datasets(lst)
+
+    assert len(lst) == 2
+    assert list(merged.columns) == ["year", "value", "location", "valid_from"]
+    assert list(merged.location) == ["https://sws.geonames.org/1"] * 2 + ["https://sws.geonames.org/2"]
+    assert list(merged.value) == [1.0, 2.0, 3.0]
+
+
+def test_merge_datasets_aligns_on_shared_columns():
+    lst = [
+        dataset("https://sws.geonames.org/1", year=["2017", "2018"], a=[1.0, 2.0]),
+        dataset("https://sws.geonames.org/1", year=["2018"], b=[3.0]),
+    ]
+    expected = pd.merge(lst[0].dataframe, lst[1].dataframe, how="outer")
+    merged = merge_datasets(lst, keep_metadata=False)
+    pd.testing.assert_frame_equal(merged, expected)
+
+    frames = merge_datasets(lst, lazy=True)
+    assert not isinstance(frames, pd.DataFrame)
+    assert [len(df) for df in frames] == [2, 1]
+
+
+def chained_merge(lst, keep_metadata):
+    # the pairwise outer merges `merge_datasets` replaced
+    frames = list(dataset_frames(lst, keep_metadata))
+    merged = frames[0]
+    for df in frames[1:]:
+        merged = pd.merge(merged, df, how="outer")
+    return merged
+
+
+@pytest.mark.parametrize("keep_metadata", [False, True])
+@pytest.mark.parametrize(
+    "columns",
+    [
+        # overlapping keys
+        [{"year": ["2017", "2018"], "a": [1.0, 2.0]}, {"year": ["2018", "2019"], "b": [3.0, 4.0]}],
+        # disjoint keys
+        [{"year": ["2017"], "a": [1.0]}, {"year": ["2018"], "b": [2.0]}, {"year": ["2019"], "c": [3.0]}],
+        # duplicate keys
+        [{"year": ["2018", "2018"], "a": [1.0, 2.0]}, {"year": ["2018", "2017"], "b": [3.0, 4.0]}],
+        [{"year": ["2018", "2018"], "a": [1.0, 1.0]}, {"year": ["2018"], "a": [1.0]}],
+    ],
+)
+def test_merge_datasets_matches_chained_outer_merge(columns, keep_metadata):
+    lst = [dataset("https://sws.geonames.org/1", **data) for data in columns]
+    pd.testing.assert_frame_equal(
+        merge_datasets(lst, keep_metadata=keep_metadata), chained_merge(lst, keep_metadata)
+    )
+
+
+def test_merge_datasets_stacks_datasets_without_shared_data_columns():
+    lst = [
+        dataset(
+            "https://sws.geonames.org/1",
+            climate_type=["default"] * 3,
+            fert_type=["inorganic"] * 3,
+            value_type=["value", "lower", "upper"],
+            emission_factor=[0.01, 0.001, 0.018],
+        ),
+        dataset("https://sws.geonames.org/1", other=[1.0]),
+    ]
+    merged = merge_datasets(lst)
+
+    assert len(merged) == 4
+    assert list(merged.emission_factor[:3]) == [0.01, 0.001, 0.018]
+
+
+def test_get_model_data_groups_by_relation(datastore):
+    results = get_model_data(ProductIRI(MAIZE), DatasetKind.PARAMETERS)
+    assert {str(ds.product) for ds in results["exactMatch"]} == {MAIZE}
+    assert {str(ds.product) for ds in results["broader"]} == {CROP}
+    assert results["narrower"] == []
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import batch
+
+from .conftest import FRANCE, GERMANY, MAIZE, WHEAT
+
+
+def test_run_batch_matches_single_formula(datastore):
+    demands = pd.DataFrame(
+        {
+            "product_iri": [MAIZE, WHEAT, MAIZE],
+            "spatial_context": [FRANCE, GERMANY, GERMANY],
+            "year": ["2018", "2017", "2018"],
+            "climate_type": [None, "wet", "dry"],
+            "fertilizer_amount": [None, None, 0.02],
+        }
+    )
+    result = batch.run_batch(demands)
+
+    assert set(result["demand"]) == {0, 1, 2}
+    assert (result.groupby("demand")["value_type"].apply(set) == {"value", "min", "max"}).all()
+    value = result[(result.demand == 0) & (result.value_type == "value")].iloc[0]
+    assert value["emission_factor"] == 0.01
+    assert value["N2O emission"] == pytest.approx(44 / 28 * 0.01 * 0.01)
+    assert value["N2O emission per ha"] == pytest.approx(value["N2O emission"] * 10000)
+    wet = result[(result.demand == 1) & (result.value_type == "value")]
+    assert list(wet["fert_type"]) == ["inorganic"]
+    assert np.allclose(result.loc[result.demand == 2, "fertiliser_input"], 0.02)
+    assert (result["crop_yield"] == 0.9).all()
+
+
+def test_run_batch_reports_missing_data(datastore):
+    demands = pd.DataFrame(
+        {"product_iri": [MAIZE], "spatial_context": [FRANCE], "year": ["1990"]}
+    )
+    result = batch.run_batch(demands, tables=batch.load_tables())
+    assert result["N2O emission"].isna().all()
+
+
+def test_run_batch_with_samples(datastore):
+    from main import RunConfig
+
+    demands = pd.DataFrame({"product_iri": [MAIZE, WHEAT], "spatial_context": [FRANCE, GERMANY]})
+    result = batch.run_batch(demands, run_config=RunConfig(num_samples=500, seed=3))
+    assert result["N2O emission per ha p50"].notna().all()
+    assert (result["N2O emission per ha p2.5"] <= result["N2O emission per ha p97.5"]).all()
+
+
+def test_arun_batch_matches_run_batch(datastore):
+    import asyncio
+
+    demands = pd.DataFrame(
+        {"product_iri": [MAIZE, WHEAT], "spatial_context": [FRANCE, GERMANY], "year": ["2018", "2017"]}
+    )
+    result = asyncio.run(batch.arun_batch(demands))
+    pd.testing.assert_frame_equal(result, batch.run_batch(demands))
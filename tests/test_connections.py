@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import peewee
+import pytest
+
+import connections
+from manifest import stored_dataset_ids
+
+
+def test_reading_is_read_only(datastore):
+    from sentier_data_tools.local_storage.db import Dataset
+
+    with connections.reading() as pool:
+        assert stored_dataset_ids() == {entry["id"] for entry in datastore.datasets.values()}
+        with pytest.raises(peewee.OperationalError):
+            connections.bind(Dataset.delete()).execute()
+    assert pool.is_closed()
+    assert connections.writer().execute_sql("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_reading_keeps_its_snapshot_during_a_build(datastore):
+    from sentier_data_tools.local_storage.db import Dataset
+
+    stored = stored_dataset_ids()
+    with connections.reading():
+        assert stored_dataset_ids() == stored
+
+        def wipe():
+            with connections.writing():
+                Dataset.delete().execute()
+
+        thread = threading.Thread(target=wipe)
+        thread.start()
+        thread.join()
+        assert stored_dataset_ids() == stored
+    assert stored_dataset_ids() == set()
+
+
+def test_manifest_is_written_on_commit(datastore, tmp_path):
+    from manifest import BuildManifest
+
+    manifest = BuildManifest(tmp_path / "build.json", sources={"yield": {"checksum": "x"}})
+    with pytest.raises(RuntimeError):
+        with connections.writing():
+            manifest.save()
+            raise RuntimeError
+    assert not manifest.path.exists()
+
+    with connections.writing():
+        with connections.writing():
+            manifest.save()
+        assert not manifest.path.exists()
+    assert BuildManifest.load(manifest.path).sources == manifest.sources
+
+
+def test_read_only_runs_beside_a_rebuild(datastore, crop):
+    import create_data
+    from main import Crop
+
+    crop.run_config.read_only = True
+    crop.run_config.num_samples = 0
+    expected = crop.run()["N2O emission per ha"].tolist()
+
+    def run(_):
+        return Crop(user_input=crop.demand, run_config=crop.run_config).run()["N2O emission per ha"].tolist()
+
+    with ThreadPoolExecutor(4) as executor:
+        rebuild = executor.submit(create_data.build_local_datastorage, rebuild=True)
+        results = list(executor.map(run, range(8)))
+        rebuild.result()
+
+    assert results == [expected] * 8
+
+
+def test_read_only_run_loads_the_manifest_once(datastore, crop, monkeypatch):
+    import main
+    import result_cache
+
+    monkeypatch.setattr(result_cache, "result_cache", result_cache.ResultCache)
+    loads = []
+    load = main.BuildManifest.load
+    monkeypatch.setattr(main.BuildManifest, "load", lambda *args: loads.append(1) or load(*args))
+    crop.run_config.read_only = True
+    crop.run_config.cache_results = True
+    crop.run()
+
+    assert len(loads) == 1
+    assert crop.build_id == datastore.build_id
+
+
+def test_manifest_is_replaced_in_one_step(datastore):
+    from manifest import BuildManifest
+
+    datastore.save()
+    assert not datastore.path.with_suffix(".tmp").exists()
+    assert BuildManifest.load(datastore.path).build_id == datastore.build_id
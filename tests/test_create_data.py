@@ -0,0 +1,94 @@
+import pytest
+
+import create_data
+from manifest import BuildManifest
+from sentier_data_tools.local_storage.db import Dataset
+
+from .conftest import FRANCE, GERMANY, MAIZE, WHEAT
+
+
+def test_build_reuses_existing_store(local_db, sources, monkeypatch):
+    manifest = create_data.build_local_datastorage()
+    assert manifest.is_complete()
+    count = Dataset.select().count()
+
+    monkeypatch.setattr(create_data, "create_yield_local_datastorage", pytest.fail)
+    again = create_data.build_local_datastorage()
+    assert again.build_id == manifest.build_id
+    assert Dataset.select().count() == count
+
+
+def test_refresh_rewrites_only_changed_datasets(local_db, sources):
+    first = create_data.build_local_datastorage()
+    ids = {key: entry["id"] for key, entry in first.datasets.items()}
+
+    changed = sources["fertiliser"]
+    changed.loc[(changed.CropIRI == MAIZE) & (changed.Country == FRANCE), "N_kg_m2"] = 0.02
+    second = create_data.build_local_datastorage(refresh=True)
+
+    rewritten = {key for key, entry in second.datasets.items() if entry["id"] != ids[key]}
+    assert rewritten == {f"fertiliser|{MAIZE}|{FRANCE}"}
+    assert second.datasets[f"fertiliser|{MAIZE}|{FRANCE}"]["version"] == 2
+    assert second.build_id != first.build_id
+    assert Dataset.select().count() == len(ids)
+    assert BuildManifest.load().build_id == second.build_id
+
+
+def test_missing_datasets_trigger_rebuild(local_db, sources):
+    create_data.build_local_datastorage()
+    Dataset.delete().execute()
+    assert not BuildManifest.load().is_complete()
+
+    manifest = create_data.build_local_datastorage()
+    assert manifest.is_complete()
+
+
+def test_only_crop_country_pairs_with_data_are_written(local_db, sources):
+    fertiliser = sources["fertiliser"]
+    sources["fertiliser"] = fertiliser[~((fertiliser.CropIRI == WHEAT) & (fertiliser.Country == GERMANY))]
+    create_data.create_fertiliser_local_datastorage()
+
+    stored = {(str(ds.product), str(ds.location)) for ds in Dataset.select()}
+    assert len(stored) == 3
+    assert (WHEAT, GERMANY) not in stored
+    assert all(len(ds.dataframe) == 2 for ds in Dataset.select())
+
+
+def test_build_without_manifest_replaces_stored_datasets(datastore):
+    count = Dataset.select().count()
+    datastore.path.unlink()
+
+    manifest = create_data.build_local_datastorage()
+    assert Dataset.select().count() == count
+    assert manifest.is_complete()
+    assert {row.id for row in Dataset.select(Dataset.id)} == {entry["id"] for entry in manifest.datasets.values()}
+
+
+def test_edited_emission_factors_are_rebuilt(local_db, sources, tmp_path, monkeypatch):
+    ef_path = tmp_path / "EF.csv"
+    ef_path.write_text(create_data.EF_PATH.read_text())
+    monkeypatch.setattr(create_data, "EF_PATH", ef_path)
+    first = create_data.build_local_datastorage()
+
+    ef_path.write_text(ef_path.read_text().replace(";0.01\n", ";0.011\n", 1))
+    second = create_data.build_local_datastorage()
+
+    assert second.build_id != first.build_id
+    rewritten = {key for key, entry in second.datasets.items() if entry["version"] == 2}
+    assert rewritten and rewritten <= second.source_keys("emission_factors")
+
+
+def test_stale_sources_are_checked_again(local_db, sources, monkeypatch):
+    import time
+
+    first = create_data.build_local_datastorage()
+    for source in create_data.REMOTE_SOURCES:
+        first.sources[source]["checked"] = time.time() - create_data.sources.MAX_AGE - 1
+    first.save()
+    checked = []
+    monkeypatch.setattr(create_data, "create_crop_yields_data", lambda refresh=False: checked.append(1) or sources["yield"].copy())
+
+    second = create_data.build_local_datastorage()
+    assert checked == [1]
+    assert second.build_id == first.build_id
+    assert create_data.is_current(BuildManifest.load())
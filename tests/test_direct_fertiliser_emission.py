@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sentier_data_tools import ProductIRI
+
+import DirectFertiliserEmission as dfe
+
+from .conftest import CROP, MAIZE
+
+
+def test_n2o_emission_broadcasts_and_writes_in_place():
+    ef = pd.Series([0.01, 0.001, 0.018], index=["value", "min", "max"])
+    result = dfe.n2o_emission(100, ef)
+    assert list(result.index) == ["value", "min", "max"]
+    assert result["value"] == pytest.approx(44 / 28)
+
+    out = np.empty(3)
+    returned = dfe.n2o_emission(np.array([1.0, 2.0, 3.0]), ef.to_numpy(), out=out)
+    assert returned is out
+    assert np.allclose(out, 44 / 28 * np.array([0.01, 0.002, 0.054]))
+
+
+def test_get_emission_leaves_input_untouched():
+    factors = pd.DataFrame({"emission_factor": [0.01, 0.016]})
+    result = dfe.get_emission(factors, 7)
+    assert list(factors.columns) == ["emission_factor"]
+    assert np.allclose(result["emission [kg_N20/ha]"], 44 / 28 * 7 * factors["emission_factor"])
+
+
+def test_emission_factor_store():
+    store = dfe.emission_factor_store()
+    assert store is dfe.emission_factor_store()
+    assert store.table.index.names == dfe.EF_KEY
+    assert store.table.reset_index()["climate_type"].dtype == "category"
+    assert store.get(CROP, "wet", "inorganic", "max") == 0.019
+
+    factors = dfe.get_emission_factors(ProductIRI(MAIZE), "dry")
+    assert list(factors["value_type"]) == ["value", "min", "max"]
+    assert list(factors["emission_factor"]) == [0.005, 0, 0.011]
+    assert dfe.get_emission_factors(ProductIRI(MAIZE), "unknown").empty
+
+
+def test_resolver_caches_per_key_and_build():
+    frame = dfe.emission_factor_store().factors(CROP).astype({"climate_type": str, "fert_type": str})
+    calls = []
+
+    def candidates():
+        calls.append(1)
+        yield frame.iloc[0:0]
+        yield frame
+
+    resolver = dfe.EmissionFactorResolver()
+    rows = resolver.resolve(MAIZE, "wet", dfe.INORGANIC_FERT_TYPES, "build-1", candidates)
+    assert list(rows["fert_type"]) == ["inorganic"] * 3
+
+    rows.loc[0, "emission_factor"] = -1
+    again = resolver.resolve(ProductIRI(MAIZE), "wet", ["inorganic", "default"], "build-1", candidates)
+    assert len(calls) == 1
+    assert (again["emission_factor"] >= 0).all()
+
+    resolver.resolve(MAIZE, "wet", dfe.INORGANIC_FERT_TYPES, "build-2", candidates)
+    assert len(calls) == 2
+
+
+def test_resolver_without_match_keeps_factor_columns():
+    resolver = dfe.EmissionFactorResolver()
+    unrelated = pd.DataFrame({"location": ["x"]})
+    rows = resolver.resolve(MAIZE, "wet", dfe.INORGANIC_FERT_TYPES, "b", lambda: [unrelated])
+
+    assert rows.empty
+    assert list(rows.columns) == dfe.FACTOR_COLUMNS
+
+
+def test_resolver_from_many_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    frame = dfe.emission_factor_store().factors(CROP).astype({"climate_type": str, "fert_type": str})
+    resolver = dfe.EmissionFactorResolver(maxsize=2)
+    climates = ["wet", "dry", "default"] * 50
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(
+            executor.map(
+                lambda climate: resolver.resolve(MAIZE, climate, ["default", "inorganic"], "b", lambda: [frame]),
+                climates,
+            )
+        )
+    assert all(set(rows["climate_type"]) == {climate} for climate, rows in zip(climates, results))
+    assert len(resolver._rows) == 2
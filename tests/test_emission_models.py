@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+import emission_models
+from emission_models import EmissionModel
+
+
+@pytest.fixture
+def per_kg(monkeypatch):
+    """Second model with the same factors, registered for one test."""
+
+    def compute(inputs):
+        rows = inputs["emission_factor"].copy()
+        rows["N2O emission per kg"] = (
+            inputs["fertiliser_input"] * rows["emission_factor"] / inputs["crop_yield"]
+        )
+        return rows
+
+    model = EmissionModel(
+        "per_kg", compute, values=("crop_yield", "fertiliser_input"), fert_types=("inorganic", "default")
+    )
+    monkeypatch.setitem(emission_models.EMISSION_MODELS, "per_kg", model)
+    return model
+
+
+def test_registry():
+    assert emission_models.get_models(["direct_inorganic"])[0].uncertainty
+    with pytest.raises(ValueError):
+        emission_models.register(EmissionModel("direct_inorganic", lambda inputs: pd.DataFrame()))
+    with pytest.raises(ValueError):
+        EmissionModel("unknown", lambda inputs: pd.DataFrame(), values=["manure_input"])
+    with pytest.raises(KeyError):
+        emission_models.get_models(["direct_organic"])
+
+
+def test_needs_are_deduplicated(per_kg):
+    models = emission_models.get_models(["direct_inorganic", "per_kg"])
+
+    assert emission_models.needed_values(models) == ["fertiliser_input", "crop_yield"]
+    assert emission_models.needed_fert_types(models) == [("default", "inorganic")]
+
+
+def test_crop_evaluates_models_in_one_pass(datastore, crop, per_kg, monkeypatch):
+    import DirectFertiliserEmission as dfe
+    from main import Crop
+
+    queries = []
+    get_model_data = Crop.get_model_data
+    monkeypatch.setattr(
+        Crop, "get_model_data", lambda self, product, kind: queries.append(kind) or get_model_data(self, product, kind)
+    )
+    dfe.emission_factor_resolver().clear()
+    crop.run_config.emission_models = ["direct_inorganic", "per_kg"]
+    result = crop.run()
+
+    assert len(queries) == 1
+    assert crop.metrics.as_dict()["get_all_input"]["ef_cache_misses"] == 1
+    assert result.groupby("model").size().to_dict() == {"direct_inorganic": 3, "per_kg": 3}
+    value = result[(result.model == "per_kg") & (result.value_type == "value")].iloc[0]
+    assert value["N2O emission per kg"] == pytest.approx(0.01 * 0.01 / 0.9)
+    assert list(crop.emission_percentiles.index) == ["direct_inorganic"]
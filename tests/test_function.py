@@ -0,0 +1,37 @@
+import pandas as pd
+from sentier_data_tools import ProductIRI
+
+import function as fct
+
+from .conftest import CROP, MAIZE, WHEAT
+
+RICE = "http://aims.fao.org/aos/agrovoc/c_6599"
+
+
+def test_find_match_IRI():
+    candidates = [ProductIRI(CROP), ProductIRI(WHEAT)]
+    assert fct.find_match_IRI(ProductIRI(WHEAT), candidates) is candidates[1]
+    assert fct.find_match_IRI(ProductIRI(MAIZE), candidates) is candidates[0]
+    assert fct.find_match_IRI(ProductIRI(MAIZE), candidates, allow_broader=False) is None
+    assert fct.find_match_IRI(ProductIRI(RICE), candidates) is None
+
+
+def test_match_many():
+    matcher = fct.IRIMatcher([CROP])
+    series = pd.Series([MAIZE, WHEAT, RICE, MAIZE])
+    matched = matcher.match_many(series)
+    assert matched.isna().tolist() == [False, False, True, False]
+    assert set(matched.dropna()) == {CROP}
+    assert matcher.match_many([CROP]) == [CROP]
+    assert matcher.match.cache_info().currsize == 4
+
+
+def test_format_df_interns_iris():
+    df = pd.DataFrame({"crop_iri": [CROP, MAIZE, CROP, None], "value": range(4)})
+    formatted = fct.format_df(df, ["crop_iri"])
+
+    assert formatted["crop_iri"].dtype == "category"
+    assert formatted["crop_iri"][0] is formatted["crop_iri"][2]
+    assert formatted["crop_iri"][0] is fct.intern_iri(CROP)
+    assert isinstance(formatted["crop_iri"][1], ProductIRI)
+    assert (formatted["crop_iri"] == ProductIRI(CROP)).tolist() == [True, False, True, False]
@@ -0,0 +1,72 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+AGRIPEEPS_DIR = Path(__file__).parent.parent / "agripeeps"
+# dependencies that only load once a function needs them
+DEFERRED = ("sentier_data_tools", "faostat", "country_converter", "rdflib")
+# import time of a module on top of pandas, which every agripeeps module needs
+BUDGET_SECONDS = 0.3
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], cwd=AGRIPEEPS_DIR, capture_output=True, text=True, check=True
+    )
+
+
+def import_seconds(module: str) -> dict[str, float]:
+    """Cumulative import time per top-level module from `-X importtime`."""
+    found = {}
+    for line in run_python("-X", "importtime", "-c", f"import {module}").stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        found.setdefault(name.strip(), int(cumulative) / 1e6)
+    return found
+
+
+@pytest.mark.parametrize("module", ["batch", "create_data", "manifest", "sources", "snapshot"])
+def test_heavy_dependencies_are_deferred(module):
+    script = (
+        "import json, sys, types\n"
+        f"import {module}\n"
+        f"print(json.dumps([name for name in {DEFERRED!r} if type(sys.modules.get(name)) is types.ModuleType]))"
+    )
+    assert json.loads(run_python("-c", script).stdout) == []
+
+
+@pytest.mark.parametrize("module", ["batch", "create_data"])
+def test_import_time_budget(module):
+    # best of three runs against noise from other processes
+    own = min(
+        times[module] - times.get("pandas", 0.0)
+        for times in (import_seconds(module) for _ in range(3))
+    )
+    assert own < BUDGET_SECONDS, f"importing {module} takes {own:.3f}s on top of pandas"
+
+
+def test_main_leaves_logging_alone():
+    script = "import logging, main\nprint(len(logging.getLogger().handlers))"
+    assert run_python("-c", script).stdout.strip() == "0"
+
+
+def test_import_does_not_silence_warnings():
+    # dependencies add narrow filters of their own, a blanket "ignore" would hide every warning
+    script = (
+        "import warnings, main, create_data\n"
+        "print(any(action == 'ignore' and message is None and category is Warning "
+        "for action, message, category, module, line in warnings.filters))"
+    )
+    assert run_python("-c", script).stdout.strip() == "False"
+
+
+def test_datastore_dir_matches_sentier():
+    from sentier_data_tools.local_storage.db import sqlite_dir_platformdirs
+
+    import paths
+
+    assert paths.DATASTORE_DIR == sqlite_dir_platformdirs
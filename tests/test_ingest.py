@@ -0,0 +1,52 @@
+from datetime import date
+
+import pandas as pd
+from sentier_data_tools.local_storage.db import Dataset
+
+import ingest
+
+from .conftest import FRANCE, MAIZE
+
+
+def records(n):
+    return [
+        dict(
+            name=f"dataset {i}",
+            dataframe=pd.DataFrame({"year": ["2018"], "value": [float(i)]}),
+            product=MAIZE,
+            columns=[],
+            metadata={},
+            location=FRANCE,
+            version=1,
+            valid_from=date(2000, 1, 1),
+            valid_to=date(2028, 1, 1),
+        )
+        for i in range(n)
+    ]
+
+
+def test_bulk_insert_in_batches_on_a_process_pool(local_db, monkeypatch):
+    from concurrent.futures import ProcessPoolExecutor
+
+    start_methods = []
+
+    class RecordingPool(ProcessPoolExecutor):
+        def __init__(self, *args, mp_context=None, **kwargs):
+            start_methods.append(mp_context.get_start_method())
+            super().__init__(*args, mp_context=mp_context, **kwargs)
+
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", RecordingPool)
+    ids = ingest.bulk_insert(records(7), batch_size=3, workers=2)
+
+    assert len(ids) == len(set(ids)) == 7
+    assert start_methods == ["spawn"]
+    for i, dataset_id in enumerate(ids):
+        dataset = Dataset.get_by_id(dataset_id)
+        assert dataset.name == f"dataset {i}"
+        assert dataset.dataframe["value"].tolist() == [float(i)]
+
+
+def test_bulk_insert_serializes_in_process_by_default(local_db, monkeypatch):
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", None)
+
+    assert len(ingest.bulk_insert(records(300))) == 300
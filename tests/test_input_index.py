@@ -0,0 +1,39 @@
+import pandas as pd
+
+from input_index import InputIndex
+
+from .conftest import FRANCE, GERMANY, MAIZE, WHEAT
+
+
+def tables():
+    fertiliser = pd.DataFrame(
+        {
+            "product": [MAIZE, MAIZE, MAIZE, WHEAT],
+            "location": [FRANCE, FRANCE, FRANCE, GERMANY],
+            "year": ["2010", "2014", "2018", "2018"],
+            "fertiliser_input": [0.01, 0.02, 0.03, 0.04],
+        }
+    )
+    crop_yield = pd.DataFrame(columns=["product", "location", "year", "crop_yield"])
+    return {"fertiliser_input": fertiliser, "crop_yield": crop_yield}
+
+
+def test_exact_and_nearest_year():
+    index = InputIndex(tables())
+
+    assert index.lookup("fertiliser_input", MAIZE, FRANCE, "2014") == (0.02, 2014)
+    assert index.lookup("fertiliser_input", MAIZE, FRANCE, 2016) == (0.02, 2014)
+    assert index.lookup("fertiliser_input", MAIZE, FRANCE, "2017") == (0.03, 2018)
+    assert index.lookup("fertiliser_input", MAIZE, FRANCE, "2030") == (0.03, 2018)
+    assert index.lookup("fertiliser_input", MAIZE, FRANCE, None) == (0.03, 2018)
+    assert index.lookup("fertiliser_input", MAIZE, FRANCE, "2016", nearest=False) is None
+    assert index.lookup("fertiliser_input", MAIZE, GERMANY, "2018") is None
+    assert index.lookup("crop_yield", MAIZE, FRANCE, "2018") is None
+
+
+def test_crop_falls_back_to_nearest_year(datastore, crop):
+    crop.demand.year = "2019"
+    crop.get_all_input()
+
+    assert crop.fertilizer_amount == 0.01
+    assert crop.crop_yield_val == 0.9
@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+
+import pytest
+
+import instrumentation
+from instrumentation import Metrics
+
+
+class RecordingTracer:
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        span = {"name": name, "attributes": {}}
+        self.spans.append(span)
+
+        class Span:
+            def set_attribute(self, key, value):
+                span["attributes"][key] = value
+
+        yield Span()
+
+
+def test_crop_run_stages(datastore, crop, monkeypatch):
+    import DirectFertiliserEmission as dfe
+    from input_index import input_index
+
+    input_index.cache_clear()
+    dfe.emission_factor_resolver().clear()
+    tracer = RecordingTracer()
+    monkeypatch.setattr(instrumentation, "tracer", tracer)
+    crop.run()
+
+    metrics = crop.metrics.as_dict()
+    assert set(metrics) == {"run", "run_create_data", "get_all_input", "get_emissions"}
+    assert all(stage["calls"] == 1 and stage["seconds"] > 0 for stage in metrics.values())
+    assert metrics["run_create_data"]["datastore_reused"] == 1
+    # three to build the input index, one for the emission factors
+    assert metrics["get_all_input"]["db_queries"] == 4
+    assert metrics["get_all_input"]["rows_merged"] > 0
+    assert metrics["get_emissions"]["emission_rows"] == 3
+
+    spans = {span["name"]: span["attributes"] for span in tracer.spans}
+    assert spans["agripeeps.get_all_input"]["agripeeps.db_queries"] == 4
+
+    crop.metrics.reset()
+    crop.run()
+    assert "db_queries" not in crop.metrics.as_dict()["get_all_input"]
+
+
+def test_counters_outside_stages_are_ignored():
+    metrics = Metrics()
+    instrumentation.count("db_queries")
+    with instrumentation.stage(metrics, "outer"):
+        instrumentation.count("db_queries")
+        with instrumentation.stage(metrics, "inner"):
+            instrumentation.count("db_queries", 2)
+    with pytest.raises(ValueError):
+        with instrumentation.stage(metrics, "outer"):
+            raise ValueError
+
+    assert metrics.as_dict()["outer"]["calls"] == 2
+    assert metrics.as_dict()["outer"]["db_queries"] == 1
+    assert metrics.as_dict()["inner"]["db_queries"] == 2
+
+
+def test_counts_from_threads_are_not_lost():
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+
+    # switch threads often enough for an unlocked `+=` to lose updates
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    metrics = Metrics()
+
+    def work(_):
+        with instrumentation.stage(metrics, "run"):
+            for _ in range(2000):
+                instrumentation.count("rows")
+
+    try:
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(work, range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert metrics.as_dict()["run"]["rows"] == 8 * 2000
+    assert metrics.as_dict()["run"]["calls"] == 8
@@ -0,0 +1,72 @@
+from sentier_data_tools import ModelTermIRI, ProductIRI
+
+import iri_hierarchy
+from example.base import SentierModel
+from iri_hierarchy import HierarchyIndex, hierarchy_index
+
+from .conftest import CROP, MAIZE, WHEAT
+
+EF = "https://vocab.sentier.dev/model-terms/nitrogen_n2o_emission_factor"
+
+
+def test_local_vocabulary_hierarchy():
+    index = hierarchy_index()
+    assert index.broader(ModelTermIRI(EF)) == ("https://vocab.sentier.dev/model-terms/emission_factor",)
+    assert index.narrower(ModelTermIRI("https://vocab.sentier.dev/model-terms/emission_factor")) == (EF,)
+
+
+def test_relations_are_cached(monkeypatch):
+    index = HierarchyIndex()
+    assert index.relations(ProductIRI(CROP)) == {MAIZE: "narrower", WHEAT: "narrower", CROP: "exactMatch"}
+    assert index.broader(MAIZE) == (CROP,)
+
+    monkeypatch.setattr(ProductIRI, "broader", lambda *args, **kwargs: 1 / 0)
+    assert index.broader(MAIZE) == (CROP,)
+    assert index.relations(CROP)[MAIZE] == "narrower"
+
+
+def test_expansions_persist_until_vocabulary_changes(tmp_path, monkeypatch):
+    path = tmp_path / "cache.json"
+    index = HierarchyIndex(cache_path=path, version="1")
+    index.broader(MAIZE)
+    index.flush()
+
+    monkeypatch.setattr(ProductIRI, "broader", lambda *args, **kwargs: 1 / 0)
+    assert HierarchyIndex(cache_path=path, version="1").broader(MAIZE) == (CROP,)
+    assert HierarchyIndex(cache_path=path, version="2")._cache == {}
+
+
+def test_expansions_are_saved_in_batches_and_merged(tmp_path, monkeypatch):
+    monkeypatch.setattr(iri_hierarchy, "SAVE_EVERY", 2)
+    path = tmp_path / "cache.json"
+    first = HierarchyIndex(cache_path=path, version="1")
+    second = HierarchyIndex(cache_path=path, version="1")
+
+    first.broader(MAIZE)
+    assert not path.exists()
+    first.narrower(CROP)
+    assert path.exists()
+    second.broader(WHEAT)
+    second.flush()
+
+    assert set(HierarchyIndex(cache_path=path, version="1")._cache) == {
+        (MAIZE, "broader"),
+        (CROP, "narrower"),
+        (WHEAT, "broader"),
+    }
+
+
+def test_model_term_expansion_is_computed_once(monkeypatch):
+    class Model(SentierModel):
+        needs = {ModelTermIRI(EF): "emission_factor"}
+        provides = {ProductIRI(MAIZE): "maize"}
+
+        def run(self):
+            pass
+
+    model = Model.__new__(Model)
+    assert model._needs_broader == {"https://vocab.sentier.dev/model-terms/emission_factor"}
+    assert model._provides_broader == {CROP}
+
+    monkeypatch.setattr(iri_hierarchy.HierarchyIndex, "_lookup", lambda *args: 1 / 0)
+    assert Model.__new__(Model)._provides_broader == {CROP}
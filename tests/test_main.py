@@ -0,0 +1,69 @@
+import pytest
+
+
+def test_crop_run(datastore, crop):
+    result = crop.run()
+
+    assert crop.fertilizer_amount == 0.01
+    assert crop.crop_yield_val == 0.9
+    assert sorted(result["value_type"]) == ["max", "min", "value"]
+    value = result[result.value_type == "value"].iloc[0]
+    assert value["N2O emission per ha"] == pytest.approx(44 / 28 * 0.01 * 0.01 * 10000)
+    assert len(crop.emission_percentiles) == 1
+
+
+def test_emission_factors_are_shared_between_runs(datastore, crop):
+    import DirectFertiliserEmission as dfe
+    from main import Crop
+
+    dfe.emission_factor_resolver().clear()
+    crop.run()
+    other = Crop(user_input=crop.demand, run_config=crop.run_config)
+    other.run()
+
+    assert crop.metrics.as_dict()["get_all_input"]["ef_cache_misses"] == 1
+    assert other.metrics.as_dict()["get_all_input"]["ef_cache_hits"] == 1
+    assert other.emission_factor_val.equals(crop.emission_factor_val)
+
+
+def test_arun_matches_run(datastore, crop):
+    import asyncio
+
+    from main import Crop
+
+    expected = crop.run()
+    other = Crop(user_input=crop.demand, run_config=crop.run_config)
+    result = asyncio.run(other.arun())
+
+    assert result.equals(expected)
+    stages = other.metrics.as_dict()
+    assert stages["run"]["calls"] == stages["get_all_input"]["calls"] == 1
+    assert stages["get_all_input"]["ef_cache_hits"] == 1
+
+
+def test_arun_all(datastore, crop):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from main import arun_all
+
+    override = crop.demand.model_copy(update={"fertilizer_amount": 0.02})
+    with ThreadPoolExecutor(4) as executor:
+        results = asyncio.run(arun_all([crop.demand, override] * 3, crop.run_config, executor=executor))
+
+    values = [result.loc[result.value_type == "value", "fertiliser_input"].iloc[0] for result in results]
+    assert values == [0.01, 0.02] * 3
+    assert not crop.run_config.read_only
+
+
+def test_crop_run_without_emission_factor(datastore, crop):
+    from sentier_data_tools import ProductIRI
+
+    import resolve
+    from main import Crop
+
+    rice = crop.demand.model_copy(update={"product_iri": ProductIRI(resolve.CROP_IRIS["Rice"])})
+    result = Crop(user_input=rice, run_config=crop.run_config).run()
+
+    assert result.empty
+    assert "N2O emission per ha" in result.columns
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+import resolve
+
+from .conftest import FRANCE, GERMANY, MAIZE
+
+
+def test_country_iris_are_categorical():
+    iris = resolve.country_iris(pd.Series(["FRA", "DEU", "FRA"], index=[5, 6, 7]))
+
+    assert isinstance(iris.dtype, pd.CategoricalDtype)
+    assert list(iris.index) == [5, 6, 7]
+    assert [iri.rstrip("/") for iri in iris] == [FRANCE, GERMANY, FRANCE]
+    assert resolve.fao_country_iris(pd.Series([68, 79])).tolist() == iris.iloc[:2].tolist()
+
+
+def test_unmapped_codes_are_reported_together():
+    names = pd.Series(["Maize", "Barley", "Oats", "Barley"])
+
+    iris = resolve.crop_iris(names)
+    assert iris.tolist()[0] == MAIZE
+    assert iris.isna().tolist() == [False, True, True, True]
+
+    with pytest.raises(KeyError, match="'Barley': 2, 'Oats': 1"):
+        resolve.crop_iris(names, errors="raise")
+
+
+@pytest.mark.parametrize("values", [[None, None], ["Barley", "Oats"], []])
+def test_nothing_mapped_gives_missing_values(values):
+    iris = resolve.crop_iris(pd.Series(values, dtype=object))
+
+    assert isinstance(iris.dtype, pd.CategoricalDtype)
+    assert iris.isna().all() and len(iris) == len(values)
+    assert resolve.fao_country_iris(pd.Series([float("nan")] * 2)).isna().tolist() == [True, True]
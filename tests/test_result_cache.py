@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+import result_cache
+from result_cache import ResultCache, result_key
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResultCache()
+    monkeypatch.setattr(result_cache, "result_cache", lambda: cache)
+    return cache
+
+
+def frames(value):
+    return {"emission_per_ha": pd.DataFrame({"value_type": ["value"], "N2O emission per ha": [value]})}
+
+
+def test_result_key_is_canonical(crop):
+    key = result_key(crop.demand, crop.run_config, "build")
+
+    assert result_key(crop.demand.model_copy(update={"year": 2018}), crop.run_config, "build") == key
+    assert result_key(crop.demand.model_copy(update={"amount": 3}), crop.run_config, "build") == key
+    assert result_key(crop.demand.model_copy(update={"fertilizer_amount": 0.02}), crop.run_config, "build") != key
+    assert result_key(crop.demand, crop.run_config.model_copy(update={"seed": 2}), "build") != key
+    assert result_key(crop.demand, crop.run_config, "other build") != key
+
+
+def test_memory_tier_evicts_and_expires():
+    cache = ResultCache(maxsize=2)
+    for key in "abc":
+        cache.put(key, frames(1.0))
+    assert cache.get("a") is None
+    result = cache.get("b")
+    result["emission_per_ha"].loc[0, "N2O emission per ha"] = 5.0
+    assert cache.get("b")["emission_per_ha"].equals(frames(1.0)["emission_per_ha"])
+
+    expired = ResultCache(ttl=0)
+    expired.put("a", frames(1.0))
+    assert expired.get("a") is None
+
+
+def test_disk_tier(tmp_path):
+    ResultCache(path=tmp_path).put("a", dict(frames(1.0), emission_percentiles=None))
+    found = ResultCache(path=tmp_path).get("a")
+    assert list(found) == ["emission_per_ha"]
+    assert found["emission_per_ha"].equals(frames(1.0)["emission_per_ha"])
+
+    size = sum(file.stat().st_size for file in tmp_path.glob("*.parquet"))
+    small = ResultCache(path=tmp_path, max_bytes=size)
+    small.put("b", frames(2.0))
+    assert sorted(file.name for file in tmp_path.glob("*.parquet")) == ["b.emission_per_ha.parquet"]
+
+
+def test_crop_reuses_cached_results(datastore, crop, cache):
+    from main import Crop
+
+    crop.run_config.cache_results = True
+    expected = crop.run()
+    other = Crop(user_input=crop.demand, run_config=crop.run_config)
+    result = other.run()
+
+    assert result.equals(expected)
+    assert other.emission_percentiles.equals(crop.emission_percentiles)
+    stages = other.metrics.as_dict()
+    assert "get_all_input" not in stages
+    assert stages["run"]["result_cache_hits"] == 1
+    assert crop.metrics.as_dict()["run"]["result_cache_misses"] == 1
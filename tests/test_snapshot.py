@@ -0,0 +1,115 @@
+from pathlib import Path
+
+import pandas as pd
+from sentier_data_tools.local_storage.db import Dataset
+
+import batch
+import create_data
+from manifest import BuildManifest
+from snapshot import Snapshot, export_snapshot, import_snapshot
+
+from .conftest import FRANCE, MAIZE
+
+
+def test_export_partitions_and_tables(datastore, tmp_path):
+    snapshot = Snapshot.open(export_snapshot(tmp_path / "snapshot"))
+
+    assert snapshot.build_id == datastore.build_id
+    assert len(snapshot.entries) == Dataset.select().count()
+    (entry,) = snapshot.select(product=MAIZE, location=FRANCE, kind=create_data.sdt.DatasetKind.BOM)
+    assert entry["path"].startswith("kind=BOM/product=http%3A%2F%2Fdata.europa.eu")
+    assert entry["key"] == f"fertiliser|{MAIZE}|{FRANCE}"
+
+    for name, table in batch.load_tables(snapshot).items():
+        expected = batch.load_tables()[name]
+        pd.testing.assert_frame_equal(
+            table.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False
+        )
+
+
+def test_import_restores_build(datastore, tmp_path):
+    path = export_snapshot(tmp_path / "snapshot")
+    count = Dataset.select().count()
+    Dataset.delete().execute()
+    datastore.path.unlink()
+
+    manifest = import_snapshot(path)
+    assert manifest.build_id == datastore.build_id
+    assert manifest.is_complete()
+    assert Dataset.select().count() == count
+    # the imported build is reused rather than rebuilt from the sources
+    assert create_data.build_local_datastorage().build_id == datastore.build_id
+
+    ids = {entry["id"] for entry in BuildManifest.load().datasets.values()}
+    import_snapshot(path)
+    assert {entry["id"] for entry in BuildManifest.load().datasets.values()} == ids
+
+
+def test_import_keeps_other_kinds(datastore, tmp_path):
+    from datetime import date
+
+    path = export_snapshot(tmp_path / "snapshot")
+    broad = Dataset.create(
+        name="broad",
+        dataframe=pd.DataFrame({"a": [1]}),
+        kind=create_data.sdt.DatasetKind.BROAD,
+        product=MAIZE,
+        location=FRANCE,
+        valid_from=date(2000, 1, 1),
+        valid_to=date(2030, 1, 1),
+        columns=[],
+        metadata={},
+        version=1,
+    )
+    datastore.path.unlink()
+
+    import_snapshot(path)
+    assert Dataset.get_by_id(broad.id).name == "broad"
+
+
+def test_crop_reads_the_snapshot_in_place(datastore, crop, tmp_path):
+    import DirectFertiliserEmission as dfe
+    from main import Crop
+
+    expected = crop.run()
+    path = export_snapshot(tmp_path / "snapshot")
+    Dataset.delete().execute()
+    dfe.emission_factor_resolver().clear()
+
+    crop.run_config.snapshot = str(path)
+    other = Crop(user_input=crop.demand, run_config=crop.run_config)
+    result = other.run()
+
+    assert result.equals(expected)
+    assert other.build_id == datastore.build_id
+    assert Dataset.select().count() == 0
+    stages = other.metrics.as_dict()
+    assert "run_create_data" not in stages
+    assert "db_queries" not in stages["get_all_input"]
+
+
+
+def test_export_replaces_the_previous_snapshot(datastore, tmp_path, monkeypatch):
+    import snapshot
+
+    (tmp_path / "snapshots").mkdir()
+    path = export_snapshot(tmp_path / "snapshots" / "snapshot")
+    first = snapshot.open_snapshot(str(path))
+    Dataset.delete().where(Dataset.id == int(Path(first.entries[0]["path"]).stem.removeprefix("part-"))).execute()
+
+    # the previous snapshot is kept whole until the new one is in place
+    previous = []
+    rename = Path.rename
+
+    def recording_rename(self, target):
+        if self.name == "snapshot.tmp":
+            previous.append(Snapshot.open(path.with_name("snapshot.old")).entries)
+        return rename(self, target)
+
+    monkeypatch.setattr(Path, "rename", recording_rename)
+    export_snapshot(path)
+    monkeypatch.undo()
+
+    assert previous == [first.entries]
+    assert sorted(p.name for p in path.parent.iterdir()) == ["snapshot"]
+    assert len(snapshot.open_snapshot(str(path)).entries) == len(first.entries) - 1
@@ -0,0 +1,112 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pandas as pd
+import pytest
+from sentier_data_tools.local_storage.db import Dataset
+
+import create_data
+import sources
+
+from .conftest import FRANCE, MAIZE
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(sources, "CACHE_DIR", tmp_path / "sources")
+    return tmp_path / "sources"
+
+
+@pytest.fixture
+def csv_server():
+    """HTTP server for one CSV that honours `If-None-Match`."""
+    state = {"body": b"a,b\n1,2\n", "etag": '"v1"', "requests": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state["requests"].append(self.headers.get("If-None-Match"))
+            if self.headers.get("If-None-Match") == state["etag"]:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", state["etag"])
+            self.end_headers()
+            self.wfile.write(state["body"])
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{server.server_port}/data.csv"
+    yield state
+    server.shutdown()
+
+
+def test_fetch_csv_revalidates_with_etag(cache, csv_server, monkeypatch):
+    url = csv_server["url"]
+    assert sources.fetch_csv("data", url).to_dict("list") == {"a": [1], "b": [2]}
+    # fresh copies are served without a request
+    sources.fetch_csv("data", url)
+    assert csv_server["requests"] == [None]
+
+    sources.fetch_csv("data", url, refresh=True)
+    assert csv_server["requests"] == [None, '"v1"']
+
+    csv_server.update(body=b"a,b\n3,4\n", etag='"v2"')
+    assert sources.fetch_csv("data", url, max_age=0).to_dict("list") == {"a": [3], "b": [4]}
+    assert len(list(cache.glob("*.parquet"))) == 1
+
+    monkeypatch.setattr(sources, "OFFLINE", True)
+    assert sources.fetch_csv("data", url, refresh=True).to_dict("list") == {"a": [3], "b": [4]}
+    assert len(csv_server["requests"]) == 3
+    with pytest.raises(sources.SourceUnavailable):
+        sources.fetch_csv("other", url)
+
+
+def test_download_failure_falls_back_to_cache(cache):
+    frame = pd.DataFrame({"a": [1]})
+    sources.cached_source("data", lambda entry: (frame, {}))
+
+    def unreachable(entry):
+        raise OSError("network is unreachable")
+
+    assert sources.cached_source("data", unreachable, refresh=True).equals(frame)
+    with pytest.raises(sources.SourceUnavailable):
+        sources.cached_source("other", unreachable)
+
+
+def test_full_ingest_from_local_source_dir(local_db, cache, tmp_path, monkeypatch):
+    pd.DataFrame(
+        {
+            "Crop": ["Maize", "Maize", "Barley"],
+            "Year": ["2017_18", "2018_19", "2018_19"],
+            "ISO3_code": ["FRA", "FRA", "FRA"],
+            "N_k_t": [300.0, 320.0, 100.0],
+            "Crop_area_k_ha": [1500.0, 1600.0, 1000.0],
+        }
+    ).to_csv(tmp_path / "fubc.csv", index=False)
+    pd.DataFrame(
+        {
+            "Area Code": [68, 68, 68],
+            "Element": ["Yield", "Yield", "Production"],
+            "Item": ["Maize (corn)", "Maize (corn)", "Maize (corn)"],
+            "Year": [2017, 2018, 2018],
+            "Value": [90000, 95000, 1],
+        }
+    ).to_csv(tmp_path / "faostat-QCL.csv", index=False)
+    monkeypatch.setattr(sources, "SOURCE_DIR", tmp_path)
+    monkeypatch.setattr(sources, "OFFLINE", True)
+
+    manifest = create_data.build_local_datastorage()
+
+    assert manifest.is_complete()
+    assert {key for key in manifest.datasets if not key.startswith("emission_factors")} == {
+        f"fertiliser|{MAIZE}|{FRANCE}",
+        f"yield|{MAIZE}|{FRANCE}",
+    }
+    fertiliser = Dataset.get_by_id(manifest.datasets[f"fertiliser|{MAIZE}|{FRANCE}"]["id"]).dataframe
+    assert fertiliser[create_data.fertiliser_COLUMNS[2]].tolist() == pytest.approx([0.02, 0.02])
+    assert not list(cache.glob("*"))
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import uncertainty
+
+
+def test_sample_n2o_is_seeded_and_chunked():
+    n = 50
+    fertiliser = np.full(n, 0.01)
+    kwargs = dict(ef_value=np.full(n, 0.01), ef_min=np.full(n, 0.001), ef_max=np.full(n, 0.018), num_samples=2000)
+
+    first = uncertainty.sample_n2o(fertiliser, rng=1, chunk_size=7, **kwargs)
+    second = uncertainty.sample_n2o(fertiliser, rng=1, chunk_size=7, **kwargs)
+    assert np.array_equal(first["N2O emission per ha"], second["N2O emission per ha"])
+
+    low, median, high = first["N2O emission per ha"].mean(axis=0)
+    assert low < median < high
+    assert median == pytest.approx(44 / 28 * 0.01 * 0.01 * 10000, rel=0.05)
+
+
+def test_sample_n2o_without_spread_is_deterministic():
+    result = uncertainty.sample_n2o(
+        fertiliser=[0.01, 0.02],
+        ef_value=[0.01, 0.016],
+        ef_min=[0.01, 0.016],
+        ef_max=[0.01, 0.016],
+        crop_yield=[0.5, 0.8],
+        num_samples=10,
+    )
+    expected = 44 / 28 * np.array([0.01 * 0.01, 0.02 * 0.016])
+    assert np.allclose(result["N2O emission per ha"], (expected * 10000)[:, None])
+    assert np.allclose(result["N2O emission per kg"], (expected / [0.5, 0.8])[:, None])